@@ -0,0 +1,54 @@
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import ProfileDump
+
+
+class ProfileDumpAdmin(admin.ModelAdmin):
+    list_display = (
+        'created', 'view', 'method', 'status', 'duration', 'trigger',
+        'requested_by', 'download',
+    )
+    list_filter = ('trigger', 'view')
+    search_fields = ('view', 'path', 'requested_by')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='core_profiledump_download',
+            ),
+        ] + super().get_urls()
+
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:core_profiledump_download', args=[obj.pk]),
+            obj.file,
+        )
+    download.short_description = 'Файл .pstats'
+
+    def download_view(self, request, pk):
+        dump = get_object_or_404(ProfileDump, pk=pk)
+        if not self.has_view_permission(request, dump):
+            raise Http404
+        try:
+            return FileResponse(
+                open(dump.file_path, 'rb'), as_attachment=True,
+                filename=dump.file,
+            )
+        except FileNotFoundError:
+            raise Http404('Файл профиля удален')
+
+
+admin.site.register(ProfileDump, ProfileDumpAdmin)
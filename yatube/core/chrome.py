@@ -0,0 +1,26 @@
+import re
+
+from django.template.loader import render_to_string
+
+MARKER = '<!--chrome:{}-->'
+MARKER_RE = re.compile(rb'<!--chrome:([\w/.\-]+)-->')
+
+
+def defer(request):
+    """Вместо персональных фрагментов страница получит метки."""
+    request.defer_chrome = True
+
+
+def is_deferred(request):
+    return getattr(request, 'defer_chrome', False)
+
+
+def fill(response, request):
+    """Подставляет в общую страницу фрагменты текущего пользователя."""
+    def render(match):
+        return render_to_string(
+            match.group(1).decode(), request=request
+        ).encode()
+
+    response.content = MARKER_RE.sub(render, response.content)
+    return response
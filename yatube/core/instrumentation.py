@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+_local = threading.local()
+
+# метрики и их описания в заголовке Server-Timing
+TIMINGS = (
+    ('db', 'queries'),
+    ('cache', 'cache'),
+    ('template', 'templates'),
+)
+
+
+class Recorder:
+    """Счетчики и время по видам работы внутри одного запроса."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.seconds = Counter()
+        self.depth = Counter()
+
+    def add(self, name, seconds=0.0):
+        self.counts[name] += 1
+        self.seconds[name] += seconds
+
+    def server_timing(self, total):
+        parts = [
+            f'{name};dur={self.seconds[name] * 1000:.1f};'
+            f'desc="{self.counts[name]} {description}"'
+            for name, description in TIMINGS
+            if self.counts[name]
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        return {
+            'db_queries': self.counts['db'],
+            'db_ms': round(self.seconds['db'] * 1000, 2),
+            'cache_hits': self.counts['cache_hit'],
+            'cache_misses': self.counts['cache_miss'],
+            'cache_ms': round(self.seconds['cache'] * 1000, 2),
+            'template_ms': round(self.seconds['template'] * 1000, 2),
+        }
+
+
+def start():
+    _local.recorder = Recorder()
+    return _local.recorder
+
+
+def stop():
+    _local.recorder = None
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+def record(name, seconds=0.0):
+    recorder = current()
+    if recorder is not None:
+        recorder.add(name, seconds)
+
+
+@contextmanager
+def timed(name):
+    """Засекает время блока; вложенные блоки того же вида не считаются."""
+    recorder = current()
+    if recorder is None or recorder.depth[name]:
+        yield
+        return
+    recorder.depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.depth[name] -= 1
+        recorder.add(name, time.perf_counter() - started)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', time.perf_counter() - started)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблонизатор Django, который засекает время рендера."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
@@ -0,0 +1,56 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.sqlite_cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержку попадания в кеш SQLiteCache и LocMemCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--reads', type=int, default=20000)
+        parser.add_argument(
+            '--value-size', type=int, default=20000,
+            help='Размер значения в байтах (примерно страница ленты)',
+        )
+
+    def handle(self, *args, **options):
+        value = 'x' * options['value_size']
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': LocMemCache('benchmark', {}),
+                'sqlite': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), {}
+                ),
+            }
+            for name, cache in backends.items():
+                timings = self.measure(cache, value, options)
+                self.stdout.write(
+                    f'{name:>7}: mean {statistics.mean(timings):8.1f} us, '
+                    f'p50 {self.percentile(timings, 50):8.1f} us, '
+                    f'p99 {self.percentile(timings, 99):8.1f} us'
+                )
+
+    @staticmethod
+    def measure(cache, value, options):
+        keys = [f'page:{i}' for i in range(options['keys'])]
+        for key in keys:
+            cache.set(key, value, None)
+        timings = []
+        for i in range(options['reads']):
+            key = keys[i % len(keys)]
+            started = time.perf_counter()
+            cache.get(key)
+            timings.append((time.perf_counter() - started) * 1e6)
+        return timings
+
+    @staticmethod
+    def percentile(timings, percent):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
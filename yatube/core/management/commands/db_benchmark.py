@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+SCHEMA = '''
+CREATE TABLE post (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    pub_date REAL NOT NULL
+);
+CREATE INDEX post_pub_date ON post (pub_date DESC, id DESC);
+'''
+FEED = 'SELECT id, text FROM post ORDER BY pub_date DESC, id DESC LIMIT 10'
+WRITE = 'INSERT INTO post (text, pub_date) VALUES (?, ?)'
+# настройки SQLite по умолчанию: журнал отката, fsync на каждом коммите
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает чтение ленты во время записей в SQLite с настройками '
+            'по умолчанию и с SQLITE_PRAGMAS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        modes = {
+            'default': DEFAULT_PRAGMAS,
+            'tuned': settings.SQLITE_PRAGMAS,
+        }
+        for name, pragmas in modes.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                self.prepare(path, pragmas, options['rows'])
+                reads, writes = self.measure(path, pragmas, options)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{name:>7}: reads {len(reads) / seconds:9.0f}/s '
+                f'(p50 {self.percentile(reads, 50):7.1f} us, '
+                f'p99 {self.percentile(reads, 99):8.1f} us), '
+                f'writes {len(writes) / seconds:7.0f}/s '
+                f'(mean {statistics.mean(writes or [0]):8.1f} us)'
+            )
+
+    @staticmethod
+    def connect(path, pragmas):
+        db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        apply_pragmas(db.cursor(), pragmas)
+        return db
+
+    def prepare(self, path, pragmas, rows):
+        db = self.connect(path, pragmas)
+        db.executescript(SCHEMA)
+        db.execute('BEGIN')
+        db.executemany(
+            WRITE, ((f'Пост {i}', time.time()) for i in range(rows))
+        )
+        db.execute('COMMIT')
+        db.close()
+
+    def measure(self, path, pragmas, options):
+        reads, writes = [], []
+        deadline = time.monotonic() + options['seconds']
+
+        def reader():
+            db = self.connect(path, pragmas)
+            timings = []
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                db.execute(FEED).fetchall()
+                timings.append((time.perf_counter() - started) * 1e6)
+            reads.extend(timings)
+            db.close()
+
+        def writer():
+            db = self.connect(path, pragmas)
+            timings = []
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                db.execute(WRITE, ('Новый пост', time.time()))
+                timings.append((time.perf_counter() - started) * 1e6)
+            writes.extend(timings)
+            db.close()
+
+        threads = [
+            threading.Thread(target=reader)
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=writer)
+            for _ in range(options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return reads, writes
+
+    @staticmethod
+    def percentile(timings, percent):
+        if not timings:
+            return 0.0
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = ('Выдает токен, с которым запрос выполняется под профилировщиком '
+            '(заголовок X-Profile)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Администратор, кто запросил')
+
+    def handle(self, *args, **options):
+        username = options['username']
+        if not get_user_model().objects.filter(
+            username=username, is_staff=True
+        ).exists():
+            raise CommandError(f'{username} - не администратор')
+        self.stdout.write(make_token(username))
@@ -0,0 +1,288 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+
+# файл процесса: 8 байт заголовка (занятый размер), затем записи
+# <длина ключа><ключ JSON, выровненный до 8 байт><значение double>
+HEADER = struct.Struct('<q')
+LENGTH = struct.Struct('<i')
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+INF = float('inf')
+
+REGISTRY = {}
+
+
+def read_entries(data, used):
+    position = HEADER.size
+    while position < used:
+        length, = LENGTH.unpack_from(data, position)
+        start = position + LENGTH.size
+        key = bytes(data[start:start + length]).decode()
+        value_at = start + length + (-(LENGTH.size + length) % 8)
+        yield key, VALUE.unpack_from(data, value_at)[0], value_at
+        position = value_at + VALUE.size
+
+
+class ProcessFile:
+    """Значения метрик одного процесса в файле, отображенном в память.
+
+    Пишет только процесс-владелец, поэтому блокировки между процессами
+    не нужны: новая запись сначала заполняется, а потом сдвигается
+    занятый размер в заголовке, и читатель видит только готовые записи.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map(size)
+        self._used = HEADER.unpack_from(self._mm, 0)[0] or HEADER.size
+        # после перезапуска процесс с тем же pid продолжает старый файл
+        self._positions = {
+            key: at for key, _, at in read_entries(self._mm, self._used)
+        }
+
+    def _map(self, size):
+        self._size = size
+        self._mm = mmap.mmap(self._file.fileno(), size)
+
+    def _append(self, key):
+        encoded = key.encode()
+        value_at = (
+            self._used + LENGTH.size + len(encoded)
+            + (-(LENGTH.size + len(encoded)) % 8)
+        )
+        end = value_at + VALUE.size
+        if end > self._size:
+            size = self._size
+            while end > size:
+                size *= 2
+            self._mm.close()
+            self._file.truncate(size)
+            self._map(size)
+        LENGTH.pack_into(self._mm, self._used, len(encoded))
+        self._mm[self._used + LENGTH.size:
+                 self._used + LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self._mm, value_at, 0.0)
+        self._used = end
+        HEADER.pack_into(self._mm, 0, end)
+        self._positions[key] = value_at
+        return value_at
+
+    def inc(self, key, amount):
+        at = self._positions.get(key)
+        if at is None:
+            at = self._append(key)
+        VALUE.pack_into(
+            self._mm, at, VALUE.unpack_from(self._mm, at)[0] + amount
+        )
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+_lock = threading.Lock()
+_process = {}
+
+
+def process_file():
+    directory = settings.METRICS_DIR
+    pid = os.getpid()
+    # после fork дочерний процесс заводит свой файл
+    if _process.get('key') != (directory, pid):
+        if 'file' in _process:
+            _process.pop('file').close()
+        os.makedirs(directory, exist_ok=True)
+        _process['file'] = ProcessFile(os.path.join(directory, f'{pid}.db'))
+        _process['key'] = (directory, pid)
+    return _process['file']
+
+
+def inc(key, amount=1.0):
+    with _lock:
+        process_file().inc(key, amount)
+
+
+def collect():
+    """Суммирует значения из файлов всех процессов."""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            continue
+        used = HEADER.unpack_from(data, 0)[0]
+        for key, value, _ in read_entries(data, min(used, len(data))):
+            totals[key] += value
+    samples = defaultdict(dict)
+    for key, value in totals.items():
+        name, suffix, labels = json.loads(key)
+        samples[name][suffix, tuple(map(tuple, labels))] = value
+    return samples
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY[name] = self
+
+    def key(self, suffix, labels, **extra):
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f'{self.name}: ожидались метки {", ".join(self.labels)}'
+            )
+        items = sorted(
+            (label, str(value)) for label, value in {**labels, **extra}.items()
+        )
+        return json.dumps([self.name, suffix, items], ensure_ascii=False)
+
+    def samples(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        inc(self.key('', labels), amount)
+
+    def samples(self, values):
+        for (suffix, labels), value in sorted(values.items()):
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (INF,)
+
+    def observe(self, value, **labels):
+        # корзины хранятся сразу накопительными
+        for bound in self.buckets:
+            if value <= bound:
+                inc(self.key('_bucket', labels, le=format_value(bound)))
+        inc(self.key('_sum', labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, values):
+        series = defaultdict(dict)
+        for (suffix, labels), value in values.items():
+            series[tuple(item for item in labels if item[0] != 'le')][
+                suffix, dict(labels).get('le')
+            ] = value
+        for labels, values in sorted(series.items()):
+            for bound in self.buckets:
+                le = format_value(bound)
+                yield (f'{self.name}_bucket', labels + (('le', le),),
+                       values.get(('_bucket', le), 0.0))
+            yield (f'{self.name}_count', labels,
+                   values.get(('_bucket', '+Inf'), 0.0))
+            yield f'{self.name}_sum', labels, values.get(('_sum', None), 0.0)
+
+
+class Gauge(Metric):
+    """Значение, которое вычисляется в момент опроса."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def samples(self, values):
+        for labels, value in self.function():
+            yield self.name, tuple(sorted(labels.items())), value
+
+
+def format_value(value):
+    if value == INF:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def exposition():
+    """Все метрики в текстовом формате Prometheus."""
+    values = collect()
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples(values[metric.name]):
+            if labels:
+                name += '{%s}' % ','.join(
+                    f'{label}="{escape(text)}"' for label, text in labels
+                )
+            lines.append(f'{name} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def job_queue_depth():
+    from jobs.models import Job
+
+    rows = Job.objects.values('queue', 'status').annotate(count=Count('pk'))
+    for row in rows.order_by('queue', 'status'):
+        yield {'queue': row['queue'], 'status': row['status']}, row['count']
+
+
+REQUESTS = Counter(
+    'http_requests_total', 'Запросы по представлению, методу и статусу',
+    ('view', 'method', 'status'),
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время ответа по представлению',
+    ('view',),
+)
+FEED_QUERY_LATENCY = Histogram(
+    'feed_query_duration_seconds', 'Время выборки страницы ленты',
+    ('feed',),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Чтения из кеша: попадания и промахи',
+    ('result',),
+)
+THUMBNAIL_LATENCY = Histogram(
+    'thumbnail_generation_seconds', 'Время создания миниатюр картинки',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+JOB_QUEUE_DEPTH = Gauge(
+    'job_queue_depth', 'Задачи в очереди по статусу',
+    ('queue', 'status'), function=job_queue_depth,
+)
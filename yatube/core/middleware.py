@@ -0,0 +1,123 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation, metrics, profiling, routers
+
+request_logger = logging.getLogger('yatube.requests')
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# метки метрик: любой выдуманный метод давал бы новую серию навсегда
+METRIC_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """Закрепляет за основной базой запросы, которые пишут.
+
+    Изменяющие запросы читают только из основной базы. После записи
+    ставится короткая кука, и следующие запросы того же пользователя
+    (например, страница после редиректа из post_create) тоже читают
+    из основной базы, пока реплика догоняет.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            routers.pin_to_primary()
+        try:
+            response = self.get_response(request)
+            if routers.has_written():
+                response.set_cookie(
+                    PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                )
+        finally:
+            routers.reset()
+        return response
+
+
+def shows_timing(request):
+    # время запросов к базе не показываем посторонним
+    if settings.DEBUG or request.META.get('REMOTE_ADDR') in (
+        settings.INTERNAL_IPS
+    ):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class InstrumentationMiddleware:
+    """Замеряет запрос: общее время, запросы к базе, кеш и шаблоны.
+
+    Итоги уходят в заголовок Server-Timing (только при DEBUG, для
+    сотрудников и с адресов INTERNAL_IPS), а доля запросов
+    INSTRUMENTATION_SAMPLE_RATE пишется строкой JSON в журнал
+    yatube.requests с именем представления (posts:index, ...).
+    Каждый запрос учитывается в метриках /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = instrumentation.start()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(instrumentation.db_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            instrumentation.stop()
+        total = time.perf_counter() - started
+        if shows_timing(request):
+            response['Server-Timing'] = recorder.server_timing(total)
+        match = request.resolver_match
+        view = match.view_name if match else None
+        method = request.method
+        metrics.REQUESTS.inc(
+            view=view or '',
+            method=method if method in METRIC_METHODS else 'other',
+            status=response.status_code,
+        )
+        metrics.REQUEST_LATENCY.observe(total, view=view or '')
+        if random.random() < settings.INSTRUMENTATION_SAMPLE_RATE:
+            request_logger.info(json.dumps({
+                'time': round(time.time(), 3),
+                'view': view,
+                'method': request.method,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                **recorder.as_dict(),
+            }))
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос под cProfile по токену или случайно.
+
+    Токен (manage.py profile_token) передается в заголовке X-Profile;
+    без токена профилируется доля запросов PROFILE_SAMPLE_RATE.
+    Профили видны в админке.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        found = profiling.trigger(request)
+        if found is None:
+            return self.get_response(request)
+        return profiling.run(self.get_response, request, *found)
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileDump',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='Представление')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=2000, verbose_name='Адрес')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='Статус ответа')),
+                ('duration', models.FloatField(verbose_name='Время, мс')),
+                ('trigger', models.CharField(choices=[('token', 'По токену'), ('sample', 'Случайная выборка')], max_length=10, verbose_name='Причина')),
+                ('requested_by', models.CharField(blank=True, max_length=150, verbose_name='Запросил')),
+                ('file', models.CharField(max_length=255, verbose_name='Файл .pstats')),
+                ('summary', models.TextField(blank=True, verbose_name='Сводка')),
+                ('created', models.DateTimeField(verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
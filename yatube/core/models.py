@@ -0,0 +1,48 @@
+import os
+
+from django.conf import settings
+from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+class ProfileDump(models.Model):
+    """Профиль одного запроса (см. core.profiling)."""
+
+    TOKEN = 'token'
+    SAMPLE = 'sample'
+    TRIGGERS = (
+        (TOKEN, 'По токену'),
+        (SAMPLE, 'Случайная выборка'),
+    )
+
+    view = models.CharField('Представление', max_length=200, blank=True)
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=2000)
+    status = models.PositiveSmallIntegerField('Статус ответа')
+    duration = models.FloatField('Время, мс')
+    trigger = models.CharField('Причина', max_length=10, choices=TRIGGERS)
+    requested_by = models.CharField('Запросил', max_length=150, blank=True)
+    file = models.CharField('Файл .pstats', max_length=255)
+    summary = models.TextField('Сводка', blank=True)
+    created = models.DateTimeField('Создан')
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return self.file
+
+    @property
+    def file_path(self):
+        return os.path.join(settings.PROFILE_DIR, self.file)
+
+
+@receiver(post_delete, sender=ProfileDump)
+def profile_dump_deleted(sender, instance, **kwargs):
+    try:
+        os.remove(instance.file_path)
+    except FileNotFoundError:
+        pass
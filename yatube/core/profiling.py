@@ -0,0 +1,112 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import ProfileDump
+
+logger = logging.getLogger(__name__)
+
+SALT = 'core.profiling'
+# только заголовок: параметр адреса попал бы в журналы доступа
+# и в Referer
+HEADER = 'HTTP_X_PROFILE'
+# строк сводки, которые сохраняются рядом с файлом
+SUMMARY_LINES = 30
+
+# cProfile не умеет работать в нескольких потоках одновременно
+_lock = threading.Lock()
+
+
+def make_token(username):
+    """Подписанный токен, включающий профилирование запросов."""
+    return signing.dumps({'by': username}, salt=SALT)
+
+
+def requested_by(request):
+    """Имя администратора из токена в заголовке X-Profile."""
+    token = request.META.get(HEADER)
+    if not token:
+        return None
+    try:
+        payload = signing.loads(
+            token, salt=SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    return payload.get('by')
+
+
+def trigger(request):
+    """Причина профилировать запрос и кто его запросил или None."""
+    by = requested_by(request)
+    if by is not None:
+        return ProfileDump.TOKEN, by
+    if random.random() < settings.PROFILE_SAMPLE_RATE:
+        return ProfileDump.SAMPLE, ''
+    return None
+
+
+def file_name(view, created):
+    view = (view or 'unresolved').replace(':', '-')
+    return f'{view}-{created:%Y%m%dT%H%M%S%f}.pstats'
+
+
+def run(get_response, request, how, by=''):
+    """Выполняет запрос под cProfile и сохраняет результат в ProfileDump.
+
+    Если другой поток уже профилирует свой запрос, этот выполняется
+    без профилирования.
+    """
+    if not _lock.acquire(blocking=False):
+        return get_response(request)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    finally:
+        _lock.release()
+    duration = time.perf_counter() - started
+    try:
+        save(profiler, request, response, duration, how, by)
+    except Exception:
+        # профиль не должен ломать ответ, который уже готов
+        logger.exception('Не удалось сохранить профиль %s', request.path)
+    return response
+
+
+def save(profiler, request, response, duration, how, by):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else ''
+    created = timezone.now()
+    name = file_name(view, created)
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats(
+        'cumulative'
+    ).print_stats(SUMMARY_LINES)
+    return ProfileDump.objects.create(
+        view=view,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        status=response.status_code,
+        duration=round(duration * 1000, 2),
+        trigger=how,
+        requested_by=by,
+        file=name,
+        summary=summary.getvalue(),
+        created=created,
+    )
@@ -0,0 +1,59 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    """Дальнейшие чтения этого потока идут в основную базу."""
+    _state.pinned = True
+
+
+@contextmanager
+def primary():
+    """Чтения внутри блока идут в основную базу."""
+    pinned = is_pinned()
+    pin_to_primary()
+    try:
+        yield
+    finally:
+        _state.pinned = pinned
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+def reset():
+    _state.pinned = _state.wrote = False
+
+
+class ReplicaRouter:
+    """Чтения - из реплики REPLICA_DATABASE, записи - в default.
+
+    После первой записи поток закрепляется за основной базой, чтобы
+    сразу прочитать записанное: реплика может отставать.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.REPLICA_DATABASE is None or is_pinned():
+            return 'default'
+        return settings.REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        pin_to_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплика - копия default, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
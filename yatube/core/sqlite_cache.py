@@ -0,0 +1,238 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import instrumentation, metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT INTO cache_stats (id, count, size)
+SELECT 1, (SELECT COUNT(*) FROM cache),
+    (SELECT COALESCE(SUM(size), 0) FROM cache)
+WHERE NOT EXISTS (SELECT 1 FROM cache_stats);
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET count = count + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET count = count - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_resized AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size;
+END;
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Общий для всех процессов кеш в файле SQLite.
+
+    Запись идет в транзакциях (WAL), вытесняются давно не читанные ключи,
+    когда превышен MAX_ENTRIES или суммарный размер MAX_SIZE. Число
+    записей и их объем триггеры ведут в таблице cache_stats, чтобы
+    проверка лимитов при записи не просматривала всю таблицу.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # чтобы не писать в базу на каждом чтении, время доступа
+    # обновляется не чаще раза в секунду
+    touch_resolution = 1.0
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 0))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            # иначе INSERT OR REPLACE удаляет старую строку без триггера
+            db.execute('PRAGMA recursive_triggers=ON')
+            db.executescript(f'BEGIN IMMEDIATE; {SCHEMA} COMMIT;')
+            self._local.db = db
+            self._local.pid = pid
+        return self._local.db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, sql, params, cull=False):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rowcount = db.execute(sql, params).rowcount
+            if cull:
+                self._cull(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return rowcount
+
+    def _cull(self, db):
+        count, size = db.execute(
+            'SELECT count, size FROM cache_stats'
+        ).fetchone()
+        if count <= self._max_entries and (
+            not self._max_size or size <= self._max_size
+        ):
+            return
+        db.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (max(count // self._cull_frequency, 1),),
+        )
+        if self._max_size:
+            # старые записи удаляются, пока объем не уляжется в лимит
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM (SELECT key, SUM(size) OVER '
+                '(ORDER BY accessed DESC) AS total FROM cache) '
+                'WHERE total > ?)',
+                (self._max_size,),
+            )
+
+    def _set(self, sql, key, value, timeout):
+        expires = self.get_backend_timeout(timeout)
+        blob = pickle.dumps(value, self.pickle_protocol)
+        return self._write(
+            sql, (key, blob, expires, time.time(), len(blob)), cull=True
+        )
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        missing = object()
+        value = self._get(key, missing, version)
+        instrumentation.record('cache', time.perf_counter() - started)
+        if value is missing:
+            instrumentation.record('cache_miss')
+            metrics.CACHE_REQUESTS.inc(result='miss')
+            return default
+        instrumentation.record('cache_hit')
+        metrics.CACHE_REQUESTS.inc(result='hit')
+        return value
+
+    def _get(self, key, default, version):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._write(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            return default
+        if now - accessed > self.touch_resolution:
+            self._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._set(
+            'INSERT OR REPLACE INTO cache '
+            '(key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+            key, value, timeout,
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return bool(self._set(
+            'INSERT INTO cache (key, value, expires, accessed, size) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed, size = excluded.size '
+            'WHERE cache.expires <= excluded.accessed',
+            key, value, timeout,
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return bool(self._write(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        ))
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, self.pickle_protocol)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (blob, len(blob), key),
+            )
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._write('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        self._write('DELETE FROM cache', ())
+
+    def close(self, **kwargs):
+        # соединение живет столько же, сколько поток процесса
+        pass
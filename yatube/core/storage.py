@@ -0,0 +1,63 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(
+    r'(^|/)(?P<shard>[0-9a-f]{2}/[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})'
+    r'(\.\w+)?$'
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - SHA-256 его содержимого.
+
+    Файлы раскладываются по вложенным каталогам из первых символов хеша
+    (posts/ab/cd/abcd....jpg), поэтому ни один каталог не разрастается,
+    а одинаковые загрузки хранятся одним файлом.
+    """
+
+    shard_levels = 2
+    shard_width = 2
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        shards = [
+            digest[level * self.shard_width:(level + 1) * self.shard_width]
+            for level in range(self.shard_levels)
+        ]
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(
+            filter(None, [directory, *shards, f'{digest}{extension}'])
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # такой файл уже загружен: у одинаковых файлов одно имя;
+            # новая ссылка обновляет mtime, чтобы collect_media --min-age
+            # не удалил файл, пока пост с ним еще не закоммичен
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        # при одновременной загрузке того же файла второй получит
+        # имя с суффиксом - лишняя копия, но не потеря данных
+        return super().save(name, content, max_length)
+
+    @staticmethod
+    def is_content_addressed(name):
+        return HASHED_NAME.search(name) is not None
@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.chrome import MARKER, is_deferred
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def chrome(context, template_name):
+    """Подключает фрагмент, зависящий от пользователя.
+
+    Если страница кешируется общей для всех, на месте фрагмента остается
+    метка, которую заполняют при отдаче ответа.
+    """
+    if is_deferred(context.get('request')):
+        return mark_safe(MARKER.format(template_name))
+    return context.template.engine.get_template(template_name).render(
+        context
+    )
@@ -0,0 +1,429 @@
+import json
+import multiprocessing
+import os
+import pstats
+import sqlite3
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.urls import reverse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+
+from jobs.queue import enqueue
+
+from . import metrics, profiling, routers
+from .db import apply_pragmas
+from .middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from .models import ProfileDump
+from .sqlite_cache import SQLiteCache
+from .storage import ContentAddressedStorage
+
+
+class SQLiteCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_entries_are_shared_between_instances(self):
+        other = self.make_cache()
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_entry_is_missing(self):
+        self.cache.set('key', 'value', 0.01)
+        time.sleep(0.02)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'newer'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def stats(self):
+        db = sqlite3.connect(self.location)
+        self.addCleanup(db.close)
+        return db.execute(
+            'SELECT (SELECT count, size FROM cache_stats) = '
+            '(SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache), '
+            'count FROM cache_stats'
+        ).fetchone()
+
+    def test_running_totals_follow_writes(self):
+        self.cache.set('a', 'x' * 100)
+        self.cache.set('a', 'x' * 10)
+        self.cache.add('b', 'y')
+        self.cache.set('counter', 1)
+        self.cache.incr('counter', 10 ** 20)
+        self.assertEqual(self.stats(), (1, 3))
+        self.cache.delete('a')
+        self.assertEqual(self.stats(), (1, 2))
+        self.cache.clear()
+        self.assertEqual(self.stats(), (1, 0))
+
+    def test_running_totals_for_existing_file(self):
+        db = sqlite3.connect(self.location)
+        db.execute(
+            'CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'expires REAL, accessed REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        db.execute("INSERT INTO cache VALUES ('old', x'00', NULL, 0, 5)")
+        db.commit()
+        db.close()
+        self.make_cache().set('new', 'value')
+        self.assertEqual(self.stats(), (1, 2))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=2)
+        cache.touch_resolution = 0
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('d'), 'd')
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=3000)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, 'x' * 1000)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'x' * 1000)
+
+
+class ContentAddressedStorageTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def test_name_is_sharded_content_hash(self):
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'image'))
+        digest = (
+            '6105d6cc76af400325e94d588ce511be5bfdbb73b437dc51eca43917d7a43e3d'
+        )
+        self.assertEqual(name, f'posts/61/05/{digest}.jpg')
+        self.assertTrue(self.storage.exists(name))
+        self.assertTrue(self.storage.is_content_addressed(name))
+        self.assertFalse(self.storage.is_content_addressed('posts/a.jpg'))
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        _, files = self.storage.listdir(os.path.dirname(first))
+        self.assertEqual(files, [os.path.basename(first)])
+
+    def test_reused_file_gets_fresh_mtime(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 60)
+
+
+class SQLitePragmasTestCase(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connection_is_tuned(self):
+        # 1 - synchronous=NORMAL; тестовая база в памяти, WAL ей не нужен
+        self.assertEqual(self.pragma('synchronous'), 1)
+        for name in ('busy_timeout', 'cache_size'):
+            self.assertEqual(self.pragma(name), settings.SQLITE_PRAGMAS[name])
+
+    def test_wal_on_file_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            apply_pragmas(db.cursor(), settings.SQLITE_PRAGMAS)
+            mode, = db.execute('PRAGMA journal_mode').fetchone()
+            db.close()
+        self.assertEqual(mode, 'wal')
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.ReplicaRouter()
+        self.model = get_user_model()
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.assertEqual(self.router.db_for_read(self.model), 'replica')
+        self.assertEqual(self.router.db_for_write(self.model), 'default')
+        self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_replica_everything_uses_default(self):
+        self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    def handle(self, request, write=False):
+        def view(request):
+            if write:
+                self.router.db_for_write(self.model)
+            return HttpResponse(self.router.db_for_read(self.model))
+        return ReplicaPinningMiddleware(view)(request)
+
+    def test_middleware_pins_writes_and_following_reads(self):
+        factory = RequestFactory()
+        response = self.handle(factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = self.handle(factory.post('/'), write=True)
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.handle(request).content, b'default')
+        # состояние не переходит в следующий запрос того же потока
+        self.assertEqual(self.handle(factory.get('/')).content, b'replica')
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get(self):
+        with self.assertLogs('yatube.requests') as logs:
+            response = Client().get(reverse('posts:index'))
+        return response, json.loads(logs.records[0].getMessage())
+
+    def test_server_timing_and_sampled_log(self):
+        response, line = self.get()
+        timing = response['Server-Timing']
+        for name in ('db', 'cache', 'template', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+        self.assertEqual(line['view'], 'posts:index')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['db_queries'], 0)
+        self.assertGreater(line['cache_misses'], 0)
+        self.assertGreater(line['template_ms'], 0)
+
+    def test_cached_page_is_served_from_cache(self):
+        self.get()
+        _, line = self.get()
+        self.assertGreater(line['cache_hits'], 0)
+
+    def test_server_timing_is_hidden_from_outsiders(self):
+        client = Client(REMOTE_ADDR='203.0.113.5')
+        with self.assertLogs('yatube.requests'):
+            response = client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+        client.force_login(staff)
+        with self.assertLogs('yatube.requests'):
+            response = client.get(reverse('posts:index'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_logged(self):
+        with mock.patch('core.middleware.request_logger') as logger:
+            response = Client().get(reverse('posts:index'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+        logger.info.assert_not_called()
+
+
+def increment_in_child():
+    metrics.CACHE_REQUESTS.inc(result='hit')
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def scrape(self, **headers):
+        response = Client().get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_histogram_exposition(self):
+        histogram = metrics.Histogram(
+            'test_seconds', 'Тест', ('view',), buckets=(0.1, 1)
+        )
+        self.addCleanup(metrics.REGISTRY.pop, 'test_seconds')
+        histogram.observe(0.5, view='a"b')
+        histogram.observe(2, view='a"b')
+        text = self.scrape()
+        self.assertIn('# TYPE test_seconds histogram', text)
+        for line in (
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 0',
+            'test_seconds_bucket{view="a\\"b",le="1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 2',
+            'test_seconds_count{view="a\\"b"} 2',
+            'test_seconds_sum{view="a\\"b"} 2.5',
+        ):
+            self.assertIn(line, text)
+        with self.assertRaises(ValueError):
+            histogram.observe(1)
+
+    def test_values_from_processes_are_summed(self):
+        metrics.CACHE_REQUESTS.inc(result='hit')
+        child = multiprocessing.get_context('fork').Process(
+            target=increment_in_child
+        )
+        child.start()
+        child.join()
+        self.assertEqual(len(os.listdir(settings.METRICS_DIR)), 2)
+        self.assertIn('cache_requests_total{result="hit"} 2', self.scrape())
+
+    def test_views_are_measured(self):
+        Client().get(reverse('posts:index'))
+        Client().get(reverse('users:login'))
+        text = self.scrape()
+        for line in (
+            'http_requests_total{method="GET",status="200",'
+            'view="posts:index"} 1',
+            'http_requests_total{method="GET",status="200",'
+            'view="users:login"} 1',
+            'http_request_duration_seconds_count{view="posts:index"} 1',
+            'feed_query_duration_seconds_count{feed="index"} 1',
+            'cache_requests_total{result="miss"}',
+        ):
+            self.assertIn(line, text)
+
+    def test_unknown_methods_share_one_series(self):
+        for method in ('FOO1', 'FOO2'):
+            Client().generic(method, reverse('posts:index'))
+        text = self.scrape()
+        self.assertNotIn('FOO', text)
+        self.assertIn(
+            'http_requests_total{method="other",status="200",'
+            'view="posts:index"} 2', text
+        )
+
+    def test_job_queue_depth(self):
+        enqueue('jobs.tests.record')
+        enqueue('jobs.tests.record', queue='mail')
+        text = self.scrape()
+        for queue in ('default', 'mail'):
+            self.assertIn(
+                f'job_queue_depth{{queue="{queue}",status="queued"}} 1', text
+            )
+
+    def test_only_internal_ips_without_token(self):
+        response = Client(REMOTE_ADDR='203.0.113.5').get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required(self):
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = get_user_model().objects.create_user(username='auth')
+        self.admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'secret-42'
+        )
+        self.token = profiling.make_token('admin')
+        self.url = reverse('posts:profile', args=['auth'])
+
+    def test_request_with_token_is_profiled(self):
+        response = Client().get(self.url, HTTP_X_PROFILE=self.token)
+        self.assertEqual(response.status_code, 200)
+        dump = ProfileDump.objects.get()
+        self.assertEqual(
+            (dump.view, dump.path, dump.trigger, dump.requested_by),
+            ('posts:profile', self.url, ProfileDump.TOKEN, 'admin'),
+        )
+        self.assertTrue(dump.file.startswith('posts-profile-'))
+        self.assertTrue(dump.file.endswith('.pstats'))
+        self.assertIn('cumulative', dump.summary)
+        self.assertGreater(pstats.Stats(dump.file_path).total_calls, 0)
+
+        dump.delete()
+        self.assertFalse(os.path.exists(dump.file_path))
+
+    def test_query_param_token_is_ignored(self):
+        Client().get(self.url, {'profile': self.token})
+        self.assertFalse(ProfileDump.objects.exists())
+
+    def test_failed_save_does_not_break_response(self):
+        with mock.patch.object(
+            profiling, 'save', side_effect=OSError('диск заполнен')
+        ), self.assertLogs('core.profiling', 'ERROR'):
+            response = Client().get(self.url, HTTP_X_PROFILE=self.token)
+        self.assertEqual(response.status_code, 200)
+
+    def test_forged_or_missing_token_is_ignored(self):
+        Client().get(self.url, HTTP_X_PROFILE=self.token + 'x')
+        Client().get(self.url)
+        self.assertFalse(ProfileDump.objects.exists())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_request_is_profiled(self):
+        Client().get(reverse('posts:index'))
+        self.assertEqual(ProfileDump.objects.get().trigger, ProfileDump.SAMPLE)
+
+    def test_admin_lists_and_downloads_dumps(self):
+        Client().get(self.url, HTTP_X_PROFILE=self.token)
+        dump = ProfileDump.objects.get()
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(reverse('admin:core_profiledump_changelist'))
+        self.assertContains(response, dump.file)
+        response = client.get(
+            reverse('admin:core_profiledump_download', args=[dump.pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(dump.file, response['Content-Disposition'])
+        response.close()
+
+    def test_profile_token_command(self):
+        out = StringIO()
+        call_command('profile_token', 'admin', stdout=out)
+        token = out.getvalue().strip()
+        request = RequestFactory().get('/', HTTP_X_PROFILE=token)
+        self.assertEqual(profiling.requested_by(request), 'admin')
+        with self.assertRaises(CommandError):
+            call_command('profile_token', 'auth', stdout=StringIO())
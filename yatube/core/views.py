@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from . import metrics as registry
 
 
 def page_not_found_404(request, exception):
@@ -11,3 +17,22 @@ def csrf_failure_403(request, reason=''):
 
 def internal_server_error_500(request, reason=''):
     return render(request, 'core/500.html')
+
+
+@never_cache
+def metrics(request):
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    # без METRICS_TOKEN метрики видны только с адресов INTERNAL_IPS
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        )
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(
+        registry.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
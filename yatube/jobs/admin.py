@@ -0,0 +1,28 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job, QueuedEmail
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'task', 'queue', 'status', 'attempts', 'run_at', 'locked_by',
+    )
+    list_filter = ('status', 'queue')
+    search_fields = ('task',)
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        queryset.update(
+            status=Job.QUEUED, attempts=0, locked_by='', locked_until=None,
+            run_at=timezone.now(),
+        )
+    retry.short_description = 'Повторить выбранные задачи'
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'created', 'attempts', 'locked_by')
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
@@ -0,0 +1,83 @@
+import copy
+import pickle
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, QueuedEmail
+from .queue import enqueue, task_path
+
+MAIL_QUEUE = 'mail'
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который только кладет письма в очередь.
+
+    Запрос тратит на письмо одну вставку в базу; отправляет письма
+    задача flush через QUEUED_EMAIL_BACKEND.
+    """
+
+    def send_messages(self, email_messages):
+        queued = []
+        for message in email_messages:
+            message = copy.copy(message)
+            message.connection = None
+            queued.append(QueuedEmail(message=pickle.dumps(message)))
+        if not queued:
+            return 0
+        QueuedEmail.objects.bulk_create(queued)
+        schedule_flush()
+        return len(queued)
+
+
+def schedule_flush():
+    # одной ожидающей задачи хватает: она заберет все письма
+    pending = Job.objects.filter(
+        queue=MAIL_QUEUE, task=task_path(flush), status=Job.QUEUED
+    )
+    if not pending.exists():
+        enqueue(flush, queue=MAIL_QUEUE, delay=settings.EMAIL_FLUSH_DELAY)
+
+
+def claim_batch(sender):
+    now = timezone.now()
+    # письма, которые так и не ушли, остаются в таблице для разбора
+    free = Q(attempts__lt=settings.JOBS_MAX_ATTEMPTS) & (
+        Q(locked_by='') | Q(locked_until__lt=now)
+    )
+    ids = list(QueuedEmail.objects.filter(free).values_list(
+        'pk', flat=True
+    )[:settings.EMAIL_BATCH_SIZE])
+    QueuedEmail.objects.filter(free, pk__in=ids).update(
+        locked_by=sender,
+        locked_until=now + timedelta(seconds=settings.JOBS_LEASE),
+        attempts=F('attempts') + 1,
+    )
+    return list(QueuedEmail.objects.filter(locked_by=sender))
+
+
+def flush():
+    """Отправляет все письма очереди пачками через одно соединение."""
+    sender = uuid.uuid4().hex
+    connection = get_connection(settings.QUEUED_EMAIL_BACKEND)
+    with connection:
+        while True:
+            batch = claim_batch(sender)
+            if not batch:
+                return
+            try:
+                connection.send_messages(
+                    [pickle.loads(email.message) for email in batch]
+                )
+            except Exception:
+                # письма вернутся в очередь, задача повторится позже
+                QueuedEmail.objects.filter(locked_by=sender).update(
+                    locked_by='', locked_until=None
+                )
+                raise
+            QueuedEmail.objects.filter(locked_by=sender).delete()
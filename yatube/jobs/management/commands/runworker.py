@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import work
+
+
+def run_threads(queues, threads, burst):
+    stop = threading.Event()
+    previous = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(
+                signum, lambda *args: stop.set()
+            )
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    pool = [
+        threading.Thread(
+            target=work,
+            args=(queues, f'{name}:{number}', stop, burst),
+            name=f'worker-{number}',
+        )
+        for number in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    try:
+        # ждем с таймаутом, чтобы сигнал обрабатывался сразу
+        while any(thread.is_alive() for thread in pool):
+            for thread in pool:
+                thread.join(0.5)
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Очередь; можно указать несколько раз (по умолчанию '
+                 'все из JOBS_QUEUES)',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=settings.JOBS_WORKER_THREADS,
+            help='Потоков в каждом процессе',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Процессов-исполнителей',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда очередь опустеет',
+        )
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or settings.JOBS_QUEUES
+        threads, burst = options['threads'], options['burst']
+        self.stdout.write(
+            f'Очереди {", ".join(queues)}: процессов '
+            f'{options["processes"]}, потоков {threads}'
+        )
+        if options['processes'] == 1:
+            run_threads(queues, threads, burst)
+            return
+        # соединения с базой не должны достаться дочерним процессам
+        connections.close_all()
+        children = [
+            multiprocessing.Process(
+                target=run_threads, args=(queues, threads, burst)
+            )
+            for _ in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+                child.join()
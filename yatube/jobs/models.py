@@ -0,0 +1,64 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    queue = models.CharField('Очередь', max_length=50, default='default')
+    task = models.CharField('Функция', max_length=200)
+    args = models.TextField('Аргументы (JSON)', default='[]')
+    kwargs = models.TextField('Именованные аргументы (JSON)', default='{}')
+    status = models.CharField(
+        'Состояние', max_length=10, choices=STATUSES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=5)
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_by = models.CharField('Исполнитель', max_length=100, blank=True)
+    locked_until = models.DateTimeField(
+        'Занята до', null=True, blank=True
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_at', 'pk']
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(
+                fields=['queue', 'status', 'run_at'],
+                name='job_queue_status_run_at_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
+
+
+class QueuedEmail(models.Model):
+    """Письмо, ожидающее отправки пачкой (см. jobs.mail)."""
+
+    message = models.BinaryField('Письмо (pickle)')
+    locked_by = models.CharField('Отправитель', max_length=100, blank=True)
+    locked_until = models.DateTimeField(
+        'Занято до', null=True, blank=True
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Письма в очереди'
+
+    def __str__(self):
+        return f'Письмо #{self.pk}'
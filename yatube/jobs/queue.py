@@ -0,0 +1,167 @@
+import json
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    OperationalError, close_old_connections, connection, transaction,
+)
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import routers
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# сколько кандидатов перебирать за один захват на SQLite
+CLAIM_BATCH = 10
+# повторы записи итога задачи, если база занята
+SETTLE_ATTEMPTS = 5
+
+
+def task_path(task):
+    if isinstance(task, str):
+        return task
+    return f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, *args, queue='default', delay=0, max_attempts=None,
+            **kwargs):
+    """Ставит вызов task(*args, **kwargs) в очередь.
+
+    task - функция уровня модуля или ее путь, аргументы - значения,
+    которые сериализуются в JSON. Задача пишется в той же транзакции,
+    что и вызывающий код, поэтому при откате исчезает вместе с ним.
+    """
+    return Job.objects.create(
+        queue=queue,
+        task=task_path(task),
+        args=json.dumps(args),
+        kwargs=json.dumps(kwargs),
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def claimable(queues, now):
+    # задача исполнителя, который умер, не продлив аренду, снова доступна
+    return Q(queue__in=queues) & (
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(queues, worker):
+    """Забирает одну готовую задачу или возвращает None.
+
+    На базах с SELECT ... FOR UPDATE SKIP LOCKED исполнители не ждут
+    друг друга. В SQLite записи и так идут по одной, поэтому задача
+    захватывается условным UPDATE: из нескольких исполнителей строку
+    изменит только первый.
+    """
+    now = timezone.now()
+    lease = {
+        'status': Job.RUNNING,
+        'locked_by': worker,
+        'locked_until': now + timedelta(seconds=settings.JOBS_LEASE),
+        'attempts': F('attempts') + 1,
+    }
+    candidates = Job.objects.filter(claimable(queues, now)).order_by(
+        'run_at', 'pk'
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = candidates.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(**lease)
+    else:
+        for pk in candidates.values_list('pk', flat=True)[:CLAIM_BATCH]:
+            if Job.objects.filter(claimable(queues, now), pk=pk).update(
+                **lease
+            ):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def retry_delay(attempts):
+    delay = min(
+        settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_MAX_DELAY,
+    )
+    # разброс, чтобы упавшие вместе задачи не повторялись вместе
+    return delay * random.uniform(1, 1.25)
+
+
+def settle(write):
+    # выполненная задача не должна оставаться захваченной до конца аренды
+    for attempt in range(SETTLE_ATTEMPTS):
+        try:
+            return write()
+        except OperationalError:
+            if attempt == SETTLE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def perform(job):
+    """Выполняет захваченную задачу и записывает результат.
+
+    Успешная задача удаляется, упавшая повторяется с экспоненциальной
+    задержкой, а после max_attempts остается со статусом failed.
+    """
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        task = import_string(job.task)
+        task(*json.loads(job.args), **json.loads(job.kwargs))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s упала:\n%s', job, error)
+        if job.attempts >= job.max_attempts:
+            settle(lambda: mine.update(status=Job.FAILED, last_error=error))
+        else:
+            run_at = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+            settle(lambda: mine.update(
+                status=Job.QUEUED,
+                locked_by='',
+                locked_until=None,
+                last_error=error,
+                run_at=run_at,
+            ))
+        return False
+    settle(mine.delete)
+    return True
+
+
+def work(queues, worker, stop, burst=False):
+    """Цикл исполнителя: захват, выполнение, ожидание новых задач."""
+    # задачи читают только что записанные данные, реплика может отставать
+    routers.pin_to_primary()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim(queues, worker)
+        except OperationalError:
+            # база занята (SQLite), поток не должен из-за этого завершаться
+            logger.warning('%s: не удалось захватить задачу', worker,
+                           exc_info=True)
+            stop.wait(settings.JOBS_POLL_INTERVAL)
+            continue
+        if job is None:
+            if burst:
+                return
+            stop.wait(settings.JOBS_POLL_INTERVAL)
+            continue
+        perform(job)
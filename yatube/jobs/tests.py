@@ -0,0 +1,164 @@
+import threading
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from core import routers
+
+from .mail import MAIL_QUEUE
+from .models import Job, QueuedEmail
+from .queue import claim, enqueue, perform, work
+
+CALLS = []
+
+
+def record(*args, **kwargs):
+    CALLS.append((args, kwargs))
+
+
+def explode():
+    raise ValueError('сломалось')
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        CALLS.clear()
+        self.addCleanup(routers.reset)
+
+    def run_burst(self):
+        work(['default'], 'test', threading.Event(), burst=True)
+
+    def test_enqueued_job_runs_and_is_removed(self):
+        enqueue(record, 1, 'два', key=[3])
+        enqueue('jobs.tests.record', 4)
+        self.run_burst()
+        self.assertEqual(CALLS, [((1, 'два'), {'key': [3]}), ((4,), {})])
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_is_claimed_once(self):
+        job = enqueue(record)
+        claimed = claim(['default'], 'first')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, Job.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim(['default'], 'second'))
+
+    def test_expired_lease_is_claimed_again(self):
+        job = enqueue(record)
+        claim(['default'], 'dead')
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(claim(['default'], 'alive').locked_by, 'alive')
+
+    def test_delayed_job_and_other_queue_wait(self):
+        enqueue(record, delay=60)
+        enqueue(record, queue='mail')
+        self.assertIsNone(claim(['default'], 'worker'))
+        self.assertIsNotNone(claim(['mail'], 'worker'))
+
+    @override_settings(JOBS_RETRY_BACKOFF=10)
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue(explode, max_attempts=2)
+        started = timezone.now()
+        self.assertFalse(perform(claim(['default'], 'worker')))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(perform(claim(['default'], 'worker')))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+
+class RunWorkerTestCase(TransactionTestCase):
+    # исполнители работают в своих потоках и видят только
+    # закоммиченные задачи
+    def setUp(self):
+        CALLS.clear()
+
+    def test_runworker_burst(self):
+        for number in range(5):
+            enqueue(record, number)
+        # без --queue обслуживаются все очереди, в том числе почта
+        enqueue(record, 5, queue=MAIL_QUEUE)
+        call_command('runworker', '--burst', '--threads=3', stdout=StringIO())
+        self.assertEqual(sorted(CALLS), [((n,), {}) for n in range(6)])
+        self.assertFalse(Job.objects.exists())
+
+    def test_runworker_only_given_queue(self):
+        enqueue(record, 'почта', queue=MAIL_QUEUE)
+        enqueue(record, 'остальное')
+        call_command(
+            'runworker', '--burst', '--queue', MAIL_QUEUE, stdout=StringIO()
+        )
+        self.assertEqual(CALLS, [(('почта',), {})])
+        self.assertEqual(Job.objects.get().queue, 'default')
+
+
+@override_settings(
+    EMAIL_BACKEND='jobs.mail.QueuedEmailBackend',
+    QUEUED_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_BATCH_SIZE=2,
+)
+class QueuedEmailTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(routers.reset)
+
+    def flush(self):
+        work([MAIL_QUEUE], 'test', threading.Event(), burst=True)
+
+    def test_mail_is_queued_then_sent_over_one_connection(self):
+        for number in range(5):
+            mail.send_mail(f'Тема {number}', 'Текст', None, ['a@b.ru'])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(QueuedEmail.objects.count(), 5)
+        # на все письма достаточно одной задачи
+        self.assertEqual(Job.objects.filter(queue=MAIL_QUEUE).count(), 1)
+
+        with mock.patch.object(
+            EmailBackend, 'open', autospec=True, return_value=True
+        ) as opened:
+            self.flush()
+        opened.assert_called_once()
+        self.assertEqual(
+            [message.subject for message in mail.outbox],
+            [f'Тема {number}' for number in range(5)],
+        )
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_failed_delivery_keeps_messages(self):
+        mail.send_mail('Тема', 'Текст', None, ['a@b.ru'])
+        with mock.patch.object(
+            EmailBackend, 'send_messages', side_effect=OSError('нет связи')
+        ):
+            self.flush()
+        email = QueuedEmail.objects.get()
+        self.assertEqual((email.locked_by, email.attempts), ('', 1))
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    def test_password_reset_only_queues_mail(self):
+        get_user_model().objects.create_user(
+            username='user', email='user@example.com', password='secret-42'
+        )
+        response = Client().post(
+            reverse('users:password_reset'), {'email': 'user@example.com'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(QueuedEmail.objects.count(), 1)
+        self.flush()
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
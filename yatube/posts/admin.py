@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Comment
+from .search import match_expression, matching_post_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -18,6 +19,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = EMPTY
 
+    def get_search_results(self, request, queryset, search_term):
+        # поиск через полнотекстовый индекс вместо LIKE '%...%'
+        if not match_expression(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=matching_post_ids(search_term)), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'description',)
@@ -0,0 +1,235 @@
+import hashlib
+import math
+import random
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from core import chrome, routers
+
+from .models import Group, Post, User
+
+GENERATION_KEY = 'generation:{}'
+PAGE_KEY = 'page:{}'
+EARLY_REFRESH_BETA = 1.0
+
+CachedPage = namedtuple(
+    'CachedPage', ('response', 'generations', 'fresh_until', 'delta')
+)
+
+
+def new_generation():
+    # после вытеснения счетчика из кеша он начинается с метки времени,
+    # поэтому старые страницы не могут совпасть по ключу с новыми
+    return int(time.time() * 1000)
+
+
+def get_generations(scopes):
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            generation = new_generation()
+            if not cache.add(key, generation, None):
+                generation = cache.get(key, generation)
+            found[key] = generation
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """Инвалидирует все страницы, зависящие от переданных областей.
+
+    Внутри транзакции поколения сдвигаются еще раз после коммита:
+    читатель мог собрать страницу из старых данных и закешировать ее
+    под поколением, сдвинутым до коммита.
+    """
+    bump_now(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_now(scopes))
+
+
+def bump_now(scopes):
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, new_generation(), None)
+
+
+def scope_of(prefix, queryset):
+    return f'{prefix}:{queryset.values_list("pk", flat=True).first()}'
+
+
+def index_scopes(request):
+    return ['all']
+
+
+def group_scopes(request, slug):
+    return [scope_of('group', Group.objects.filter(slug=slug))]
+
+
+def profile_scopes(request, username):
+    return [scope_of('author', User.objects.filter(username=username))]
+
+
+def post_scopes(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True
+    ).first()
+    return [f'post:{post_id}', f'author:{author_id}']
+
+
+def resolve_scopes(scopes, request, *args, **kwargs):
+    # области нужны и для ETag, и для ключа кеша; ищем их один раз
+    if not hasattr(request, 'page_scopes'):
+        request.page_scopes = scopes(request, *args, **kwargs)
+    return request.page_scopes
+
+
+def etag_for(request, generations):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    source = '|'.join(
+        [request.get_full_path(), str(user), csrf, *map(str, generations)]
+    )
+    return hashlib.md5(source.encode()).hexdigest()
+
+
+def page_etag(scopes):
+    """ETag страницы из поколений ее областей.
+
+    Считается без запроса ленты и шаблона, поэтому на совпадение
+    If-None-Match ответ 304 отдается сразу.
+    """
+    def etag(request, *args, **kwargs):
+        return etag_for(request, get_generations(
+            resolve_scopes(scopes, request, *args, **kwargs)
+        ))
+    return etag
+
+
+def page_key(request, shared=False):
+    if shared:
+        user = 'shared'
+    else:
+        user = request.user.pk if request.user.is_authenticated else 'anon'
+    digest = hashlib.md5(
+        f'{request.get_full_path()}|{user}'.encode()
+    ).hexdigest()
+    return PAGE_KEY.format(digest)
+
+
+def is_fresh(entry, generations):
+    if entry is None or entry.generations != generations:
+        return False
+    # вероятностное раннее обновление (XFetch): чем дольше строится
+    # страница, тем раньше до истечения срока ее начинают перестраивать
+    early = -entry.delta * EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return time.time() + early < entry.fresh_until
+
+
+def wait_for_rebuild(key, generations):
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry.generations == generations:
+            return entry
+    return None
+
+
+def cacheable(request, anonymous_only):
+    return request.method in ('GET', 'HEAD') and not (
+        anonymous_only and request.user.is_authenticated
+    )
+
+
+def serve_stale(key, entry, generations, view, request, *args, **kwargs):
+    """Старая копия, пока страницу перестраивает другой запрос.
+
+    Если копии нет и перестройка не успела, страница строится без кеша.
+    """
+    if entry is None:
+        entry = wait_for_rebuild(key, generations)
+    if entry is None:
+        return view(request, *args, **kwargs)
+    if entry.generations != generations:
+        # ETag описывает отданную старую копию, а не текущие поколения,
+        # иначе клиент получал бы 304 на старую страницу до следующего
+        # изменения
+        entry.response['ETag'] = quote_etag(
+            etag_for(request, entry.generations)
+        )
+    return entry.response
+
+
+def rebuild(key, generations, timeout, view, request, *args, **kwargs):
+    started = time.monotonic()
+    # копия живет до следующего сдвига поколения, поэтому строится
+    # из основной базы: реплика может отставать от записи, которая
+    # этот сдвиг вызвала
+    with routers.primary():
+        response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        entry = CachedPage(
+            response,
+            generations,
+            time.time() + timeout,
+            time.monotonic() - started,
+        )
+        cache.set(key, entry, timeout + settings.FEED_CACHE_STALE_TIMEOUT)
+    return response
+
+
+def cached_view(scopes, timeout=None, anonymous_only=False, shared=False):
+    """Кеширует страницу вместе с поколениями областей scopes.
+
+    scopes(request, **kwargs) возвращает области, от которых зависит
+    страница; любое изменение в них делает копию устаревшей. Устаревшую
+    страницу перестраивает один запрос, остальные в это время получают
+    старую копию.
+
+    С shared=True копия одна на всех пользователей, а персональные
+    фрагменты (шапка, переключатель лент) дорисовываются при отдаче.
+    """
+    if timeout is None:
+        timeout = settings.FEED_CACHE_TIMEOUT
+
+    def decorator(view):
+        def cached(request, *args, **kwargs):
+            if not cacheable(request, anonymous_only):
+                return view(request, *args, **kwargs)
+            key = page_key(request, shared)
+            generations = get_generations(
+                resolve_scopes(scopes, request, *args, **kwargs)
+            )
+            entry = cache.get(key)
+            if is_fresh(entry, generations):
+                return entry.response
+
+            lock = f'{key}:lock'
+            if not cache.add(lock, True, settings.FEED_CACHE_LOCK_TIMEOUT):
+                return serve_stale(
+                    key, entry, generations, view, request, *args, **kwargs
+                )
+            try:
+                return rebuild(
+                    key, generations, timeout, view, request, *args, **kwargs
+                )
+            finally:
+                cache.delete(lock)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not shared:
+                return cached(request, *args, **kwargs)
+            chrome.defer(request)
+            return chrome.fill(cached(request, *args, **kwargs), request)
+        return wrapper
+    return decorator
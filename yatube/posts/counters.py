@@ -0,0 +1,26 @@
+from django.db.models import F
+
+from .models import Post, UserStats
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счетчики пользователя на заданные величины."""
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and min(deltas.values()) > 0:
+        UserStats.objects.get_or_create(user_id=user_id, defaults=deltas)
+
+
+def user_stats(user):
+    """Счетчики пользователя; если строки еще нет - нулевые."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
@@ -1,10 +1,24 @@
-from django.forms import ModelForm
+from django.core.files.uploadedfile import UploadedFile
+from django.forms import ModelForm, ValidationError
 from django.utils.translation import gettext_lazy as _
 
 from .models import Comment, Post
+from .uploads import prepare_image
 
 
 class PostForm(ModelForm):
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        if 'image' in self.upload_errors:
+            raise ValidationError(self.upload_errors['image'])
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            image = prepare_image(image)
+        return image
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image', )
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Post
+
+MAX_QUERY_PARAMS = 999
+
+
+def walk(storage, directory):
+    """Имена файлов каталога хранилища, по одному, без списка в памяти."""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(storage.path(current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat()
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов и миниатюры, на которые не ссылается '
+            'ни один пост')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие файлы будут удалены',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько файлов проверять и удалять за раз',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=24 * 60 * 60,
+            help=('Не трогать файлы моложе стольких секунд: картинка '
+                  'могла загрузиться, а пост еще не сохраниться'),
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.post_storage = Post._meta.get_field('image').storage
+        # имена живых файлов лежат во временной базе на диске,
+        # поэтому память не растет с числом постов и файлов
+        with tempfile.TemporaryDirectory() as directory:
+            live = sqlite3.connect(os.path.join(directory, 'live.sqlite3'))
+            try:
+                live.execute('CREATE TABLE live (name TEXT PRIMARY KEY)')
+                self.collect_live(live)
+                cutoff = time.time() - options['min_age']
+                roots = [
+                    (self.post_storage,
+                     Post._meta.get_field('image').upload_to.strip('/')),
+                    (default.storage,
+                     sorl_settings.THUMBNAIL_PREFIX.strip('/')),
+                ]
+                found = size = 0
+                for storage, root in roots:
+                    candidates = (
+                        (name, stat.st_size)
+                        for name, stat in walk(storage, root)
+                        if stat.st_mtime < cutoff
+                    )
+                    for batch in chunks(candidates, self.batch_size):
+                        orphans = self.orphans(live, batch)
+                        self.remove(storage, orphans)
+                        found += len(orphans)
+                        size += sum(file_size for _, file_size in orphans)
+            finally:
+                live.close()
+        action = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(
+            f'{action} файлов: {found}, {size / 1024 / 1024:.1f} МБ'
+        )
+
+    def collect_live(self, live):
+        rows = Post.objects.exclude(image='').values_list(
+            'image', 'image_thumbnails'
+        ).order_by().iterator(chunk_size=self.batch_size)
+        for batch in chunks(rows, self.batch_size):
+            names = []
+            for image, thumbnails in batch:
+                names.append(image)
+                for thumbnail in json.loads(thumbnails or '{}').values():
+                    urls = [thumbnail['url']] + [
+                        url
+                        for sources in thumbnail.get('sources', {}).values()
+                        for url, _ in sources
+                    ]
+                    names.extend(
+                        url[len(settings.MEDIA_URL):] for url in urls
+                        if url.startswith(settings.MEDIA_URL)
+                    )
+            live.executemany(
+                'INSERT OR IGNORE INTO live VALUES (?)',
+                ((name,) for name in names),
+            )
+        live.commit()
+
+    def orphans(self, live, batch):
+        referenced = set()
+        # SQLite до 3.32 принимает не больше 999 параметров в запросе
+        for names in chunks((name for name, _ in batch), MAX_QUERY_PARAMS):
+            placeholders = ', '.join('?' * len(names))
+            referenced.update(
+                name for name, in live.execute(
+                    f'SELECT name FROM live WHERE name IN ({placeholders})',
+                    names,
+                )
+            )
+        return [item for item in batch if item[0] not in referenced]
+
+    def remove(self, storage, orphans):
+        for name, _ in orphans:
+            if self.dry_run:
+                self.stdout.write(name)
+                continue
+            storage.delete(name)
+            # миниатюру без записи в хранилище ключей sorl создаст заново
+            default.kvstore.delete(
+                ImageFile(name, default.storage), delete_thumbnails=False
+            )
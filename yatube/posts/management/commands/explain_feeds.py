@@ -0,0 +1,72 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Post, TimelineEntry
+from posts.timeline import TIMELINE_KEYS
+from posts.utils import CursorPaginator
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+
+
+def feed_queries():
+    """Запросы, которые выполняют представления posts/views.py."""
+    per_page = settings.NUMB_PAGIN + 1
+    key = (timezone.now(), 0)
+    feeds = {
+        'index': Post.objects.for_feed(),
+        'group_posts': Post.objects.for_feed().filter(group_id=0),
+        'profile': Post.objects.for_feed().filter(author_id=0),
+    }
+    for name, queryset in feeds.items():
+        paginator = CursorPaginator(queryset, settings.NUMB_PAGIN)
+        yield f'{name}: page', paginator.ordered()[:per_page]
+        yield f'{name}: next', paginator.seek(key)[:per_page]
+        yield f'{name}: previous', paginator.seek(key, True)[:per_page]
+    timeline = CursorPaginator(
+        TimelineEntry.objects.filter(user_id=0).only('post_id', 'pub_date'),
+        settings.NUMB_PAGIN,
+        TIMELINE_KEYS,
+    )
+    yield 'follow_index: page', timeline.ordered()[:per_page]
+    yield 'follow_index: next', timeline.seek(key)[:per_page]
+    yield 'post_detail: comments', Comment.objects.filter(
+        post_id=0
+    ).select_related('author')
+    yield 'profile: following', Follow.objects.filter(user_id=0, author_id=0)
+    yield 'post_create: followers', Follow.objects.filter(
+        author_id=0
+    ).values_list('user_id', flat=True)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы запросов лент: без полного просмотра таблиц '
+            'и сортировки во временном B-дереве')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка рассчитана на EXPLAIN QUERY PLAN '
+                               'SQLite')
+        problems = []
+        with connection.cursor() as cursor:
+            for name, queryset in feed_queries():
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                bad = [
+                    step for step in plan
+                    if FULL_SCAN.match(step) or TEMP_SORT.search(step)
+                ]
+                status = 'FAIL' if bad else 'ok'
+                self.stdout.write(f'[{status}] {name}')
+                for step in plan:
+                    self.stdout.write(f'    {step}')
+                problems.extend(f'{name}: {step}' for step in bad)
+        if problems:
+            raise CommandError(
+                'Неоптимальные планы запросов:\n' + '\n'.join(problems)
+            )
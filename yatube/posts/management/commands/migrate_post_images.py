@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище с именами по '
+            'содержимому; одинаковые файлы сливаются в один')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие файлы будут перенесены',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = [
+            name for name in Post.objects.exclude(image='').order_by(
+                'image'
+            ).values_list('image', flat=True).distinct().iterator()
+            if not storage.is_content_addressed(name)
+        ]
+        moved = missing = 0
+        for name in names:
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Нет файла: {name}')
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'{name}')
+                moved += 1
+                continue
+            with storage.open(name) as file:
+                new_name = storage.save(name, file)
+            self.relink(name, new_name)
+            storage.delete(name)
+            moved += 1
+            self.stdout.write(f'{name} -> {new_name}')
+        action = 'Будет перенесено' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(
+            f'{action} файлов: {moved}, отсутствует файлов: {missing}'
+        )
+
+    def relink(self, name, new_name):
+        posts = Post.objects.filter(image=name)
+        scopes = {'all'}
+        for pk, author_id, group_id in posts.values_list(
+            'pk', 'author_id', 'group_id'
+        ):
+            scopes.update({f'post:{pk}', f'author:{author_id}'})
+            if group_id:
+                scopes.add(f'group:{group_id}')
+        # миниатюры уже созданы и их адреса сохранены в постах,
+        # поэтому меняется только имя исходного файла
+        posts.update(image=new_name)
+        caching.bump(*scopes)
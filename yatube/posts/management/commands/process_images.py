@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Создает миниатюры и сохраняет размеры и заглушки картинок '
+            'постов, у которых их еще нет')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать заново все картинки',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_thumbnails='')
+        total = failed = 0
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            try:
+                thumbnails.process(post_id)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Пост {post_id}: {error}')
+                continue
+            total += 1
+        self.stdout.write(
+            f'Обработано картинок: {total}, с ошибкой: {failed}'
+        )
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики постов, подписок и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправлять',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        users = self.repair_users(dry_run)
+        posts = self.repair_posts(dry_run)
+        action = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(
+            f'{action} расхождений: пользователей {users}, постов {posts}'
+        )
+
+    def repair_users(self, dry_run):
+        fields = ('posts_count', 'followers_count', 'following_count')
+        actual = User.objects.annotate(
+            real_posts_count=count_subquery(Post.objects, 'author'),
+            real_followers_count=count_subquery(Follow.objects, 'author'),
+            real_following_count=count_subquery(Follow.objects, 'user'),
+        ).values_list(
+            'pk',
+            *(f'stats__{field}' for field in fields),
+            *(f'real_{field}' for field in fields),
+        )
+        drifted = 0
+        for pk, *values in actual.iterator():
+            stored, real = values[:len(fields)], values[len(fields):]
+            if stored == real:
+                continue
+            drifted += 1
+            if not dry_run:
+                UserStats.objects.update_or_create(
+                    user_id=pk, defaults=dict(zip(fields, real))
+                )
+        return drifted
+
+    def repair_posts(self, dry_run):
+        drifted = Post.objects.annotate(
+            real_comments=count_subquery(Comment.objects, 'post')
+        ).exclude(comments_count=F('real_comments'))
+        total = 0
+        for pk, real_comments in drifted.values_list(
+            'pk', 'real_comments'
+        ).iterator():
+            total += 1
+            if not dry_run:
+                Post.objects.filter(pk=pk).update(comments_count=real_comments)
+        return total
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+CREATE = (
+    "CREATE VIRTUAL TABLE posts_search USING fts5("
+    "text, comments, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO posts_search (rowid, text, comments) "
+    "SELECT id, text, COALESCE((SELECT group_concat(text, ' ') "
+    "FROM posts_comment WHERE post_id = posts_post.id), '') "
+    "FROM posts_post",
+    "CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post "
+    "BEGIN "
+    "INSERT INTO posts_search (rowid, text, comments) "
+    "VALUES (new.id, new.text, ''); "
+    "END",
+    "CREATE TRIGGER posts_search_post_update AFTER UPDATE OF text "
+    "ON posts_post BEGIN "
+    "UPDATE posts_search SET text = new.text WHERE rowid = new.id; "
+    "END",
+    "CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post "
+    "BEGIN "
+    "DELETE FROM posts_search WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER posts_search_comment_insert AFTER INSERT "
+    "ON posts_comment BEGIN "
+    "UPDATE posts_search SET comments = (SELECT group_concat(text, ' ') "
+    "FROM posts_comment WHERE post_id = new.post_id) "
+    "WHERE rowid = new.post_id; "
+    "END",
+    "CREATE TRIGGER posts_search_comment_update AFTER UPDATE OF text, post_id "
+    "ON posts_comment BEGIN "
+    "UPDATE posts_search SET comments = COALESCE((SELECT group_concat("
+    "text, ' ') FROM posts_comment WHERE post_id = posts_search.rowid), '') "
+    "WHERE rowid IN (old.post_id, new.post_id); "
+    "END",
+    "CREATE TRIGGER posts_search_comment_delete AFTER DELETE "
+    "ON posts_comment BEGIN "
+    "UPDATE posts_search SET comments = COALESCE((SELECT group_concat("
+    "text, ' ') FROM posts_comment WHERE post_id = old.post_id), '') "
+    "WHERE rowid = old.post_id; "
+    "END",
+)
+
+DROP = (
+    "DROP TRIGGER IF EXISTS posts_search_post_insert",
+    "DROP TRIGGER IF EXISTS posts_search_post_update",
+    "DROP TRIGGER IF EXISTS posts_search_post_delete",
+    "DROP TRIGGER IF EXISTS posts_search_comment_insert",
+    "DROP TRIGGER IF EXISTS posts_search_comment_update",
+    "DROP TRIGGER IF EXISTS posts_search_comment_delete",
+    "DROP TABLE IF EXISTS posts_search",
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # полнотекстовый индекс FTS5 есть только в SQLite
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
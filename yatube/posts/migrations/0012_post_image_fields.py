@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:37
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search = import_module('posts.migrations.0011_posts_search')
+# SQLite пересоздает таблицу при добавлении полей, и триггеры
+# поискового индекса удаляются вместе со старой таблицей
+TRIGGERS = [sql for sql in search.CREATE if sql.startswith('CREATE TRIGGER')]
+RECREATE = [
+    sql for sql in search.DROP if sql.startswith('DROP TRIGGER')
+] + TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_posts_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, search.run(RECREATE)),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Заглушка картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_thumbnails',
+            field=models.TextField(blank=True, editable=False, verbose_name='Миниатюры (JSON)'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(search.run(RECREATE), migrations.RunPython.noop),
+    ]
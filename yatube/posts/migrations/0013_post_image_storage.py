@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:40
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_image_fields'),
+    ]
+
+    # хранилище не меняет схему, а AlterField в SQLite пересоздал бы
+    # таблицу постов вместе с триггерами поиска
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='post',
+                name='image',
+                field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+            ),
+        ]),
+    ]
@@ -0,0 +1,108 @@
+import math
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .utils import CursorPaginator, valid_pk
+
+SEARCH_KEYS = ('search_rank', 'pk')
+# текст поста весит вдвое больше текста комментариев
+RANK = 'bm25(posts_search, 2.0, 1.0)'
+MATCHES = (
+    f'SELECT rowid AS post_id, {RANK} AS score '
+    'FROM posts_search WHERE posts_search MATCH %s'
+)
+REBUILD = (
+    "DELETE FROM posts_search",
+    "INSERT INTO posts_search (rowid, text, comments) "
+    "SELECT id, text, COALESCE((SELECT group_concat(text, ' ') "
+    "FROM posts_comment WHERE post_id = posts_post.id), '') "
+    "FROM posts_post",
+    "INSERT INTO posts_search (posts_search) VALUES ('optimize')",
+)
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в запрос FTS5 (все слова, по префиксу)."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', query))
+
+
+def matching_post_ids(query):
+    """Подзапрос с id найденных постов, например для filter(pk__in=...)."""
+    return RawSQL(
+        'SELECT rowid FROM posts_search WHERE posts_search MATCH %s',
+        (match_expression(query),),
+    )
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        for sql in REBUILD:
+            cursor.execute(sql)
+
+
+class SearchResults:
+    """Результаты поиска, упорядоченные по релевантности.
+
+    Поддерживает только срезы: каждый срез - один запрос к индексу FTS5
+    и один запрос постов по первичному ключу.
+    """
+
+    def __init__(self, match, after=None, backwards=False):
+        self.match = match
+        self.after = after
+        self.backwards = backwards
+
+    def __getitem__(self, item):
+        start = item.start or 0
+        sql = f'SELECT post_id, score FROM ({MATCHES})'
+        params = [self.match]
+        if self.after is not None:
+            score, pk = self.after
+            sign = '<' if self.backwards else '>'
+            sql += (f' WHERE score {sign} %s '
+                    f'OR (score = %s AND post_id {sign} %s)')
+            params += [score, score, pk]
+        order = 'DESC' if self.backwards else 'ASC'
+        sql += f' ORDER BY score {order}, post_id {order} LIMIT %s OFFSET %s'
+        params += [item.stop - start, start]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranked = cursor.fetchall()
+        posts = Post.objects.for_feed().in_bulk(
+            [post_id for post_id, _ in ranked]
+        )
+        rows = []
+        for post_id, score in ranked:
+            if post_id in posts:
+                posts[post_id].search_rank = score
+                rows.append(posts[post_id])
+        return rows
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация по ключу (релевантность, pk)."""
+
+    def __init__(self, query, per_page):
+        super().__init__(match_expression(query), per_page, SEARCH_KEYS)
+
+    def sort(self, object_list):
+        # порядок задает SearchResults
+        return object_list
+
+    def dump_key(self, row_key):
+        return list(row_key)
+
+    def load_key(self, value):
+        score, pk = value
+        if not valid_pk(pk) or not math.isfinite(score):
+            raise ValueError('Некорректный ключ курсора')
+        return float(score), pk
+
+    def ordered(self):
+        return SearchResults(self.object_list)
+
+    def seek(self, row_key, backwards=False):
+        return SearchResults(self.object_list, row_key, backwards)
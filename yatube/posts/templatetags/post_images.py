@@ -0,0 +1,30 @@
+from django import template
+
+from posts.thumbnails import FALLBACK_FORMAT, PRESETS
+
+register = template.Library()
+
+
+def srcset(sources):
+    return ', '.join(f'{url} {width}w' for url, width in sources)
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post, preset):
+    """Картинка поста с srcset и sizes пресета из posts.thumbnails.
+
+    Берет только сохраненные в посте адреса миниатюр, поэтому файлы
+    и хранилище миниатюр при рендере не читаются.
+    """
+    thumbnail = post.thumbnails.get(preset)
+    context = {'post': post, 'thumbnail': thumbnail}
+    if thumbnail:
+        sources = thumbnail.get('sources', {})
+        context['sizes'] = PRESETS[preset].sizes
+        context['fallback'] = srcset(sources.get(FALLBACK_FORMAT, []))
+        context['sources'] = [
+            (f'image/{format_.lower()}', srcset(items))
+            for format_, items in sources.items()
+            if format_ != FALLBACK_FORMAT
+        ]
+    return context
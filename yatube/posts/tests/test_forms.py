@@ -1,17 +1,38 @@
+import json
+from unittest import mock
+
+from PIL import Image
+from sorl.thumbnail import default
+
+from jobs.models import Job
+
+from .. import thumbnails
 from ..forms import PostForm
 from ..models import Post, Group, Comment
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.test import TestCase, Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+import os
 import shutil
+from io import BytesIO, StringIO
 import tempfile
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -152,6 +173,107 @@ class PostCreateFormTestCase(TestCase):
         self.assertEqual(Post.objects.count(), post_count)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPregenerationTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def uploaded(self):
+        return SimpleUploadedFile(
+            name='thumb.gif',
+            content=SMALL_GIF,
+            content_type='image/gif',
+        )
+
+    def test_create_post_schedules_thumbnails(self):
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            client.post(
+                reverse('posts:post_create'),
+                data={'text': 'С картинкой', 'image': self.uploaded()},
+            )
+        schedule.assert_called_once()
+        post = schedule.call_args[0][0]
+        self.assertTrue(post.image.name.startswith('posts/'))
+
+    def test_new_image_enqueues_processing_job(self):
+        post = Post.objects.create(
+            author=self.user, text='С картинкой', image=self.uploaded()
+        )
+        job = Job.objects.get()
+        self.assertEqual(job.task, 'posts.thumbnails.process')
+        self.assertEqual(json.loads(job.args), [post.pk])
+
+    def test_process_stores_image_fields(self):
+        post = Post.objects.create(
+            author=self.user, text='С картинкой', image=self.uploaded()
+        )
+        thumbnails.process(post.pk)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        self.assertEqual(set(post.thumbnails), set(thumbnails.PRESETS))
+        card = post.thumbnails['card']
+        self.assertEqual((card['width'], card['height']), (960, 339))
+        preset = thumbnails.PRESETS['card']
+        for format_ in thumbnails.FORMATS:
+            sources = card['sources'][format_]
+            self.assertEqual(
+                [width for _, width in sources], list(preset.widths)
+            )
+            for url, _ in sources:
+                self.assertTrue(url.endswith(
+                    '.webp' if format_ == 'WEBP' else '.jpg'
+                ))
+        self.assertEqual(card['url'], card['sources']['JPEG'][-1][0])
+
+    def test_render_does_not_read_media(self):
+        post = Post.objects.create(
+            author=self.user, text='С картинкой', image=self.uploaded()
+        )
+        thumbnails.process(post.pk)
+        post.refresh_from_db()
+        cache.clear()
+        with mock.patch(
+            'django.core.files.storage.FileSystemStorage.open',
+            side_effect=AssertionError('файл читается при рендере'),
+        ), mock.patch.object(
+            default.kvstore, 'get',
+            side_effect=AssertionError('миниатюра ищется при рендере'),
+        ):
+            response = Client().get(reverse('posts:index'))
+        card = post.thumbnails['card']
+        self.assertContains(response, f'src="{card["url"]}"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, '<source type="image/webp"')
+        webp_url, width = card['sources']['WEBP'][0]
+        self.assertContains(response, f'{webp_url} {width}w')
+        self.assertContains(response, thumbnails.PRESETS['card'].sizes)
+        self.assertContains(response, post.image_placeholder)
+
+    def test_new_image_resets_stored_fields(self):
+        post = Post.objects.create(
+            author=self.user, text='С картинкой', image=self.uploaded()
+        )
+        thumbnails.process(post.pk)
+        post.refresh_from_db()
+        post.image = self.uploaded()
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.thumbnails, {})
+
+
 class CommentCreateFormTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -208,3 +330,194 @@ class CommentCreateFormTestCase(TestCase):
                 text=self.text.get('text'),
             ).exists()
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageStorageTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_duplicate_uploads_share_one_file(self):
+        first = Post.objects.create(
+            author=self.user, text='Первый',
+            image=SimpleUploadedFile('a.gif', b'GIF89a same'),
+        )
+        second = Post.objects.create(
+            author=self.user, text='Второй',
+            image=SimpleUploadedFile('b.gif', b'GIF89a same'),
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.storage.is_content_addressed(
+            first.image.name
+        ))
+
+    def test_migrate_post_images_moves_legacy_files(self):
+        storage = Post._meta.get_field('image').storage
+        legacy = 'posts/legacy.gif'
+        os.makedirs(os.path.dirname(storage.path(legacy)), exist_ok=True)
+        with open(storage.path(legacy), 'wb') as file:
+            file.write(b'GIF89a legacy')
+        posts = [
+            Post.objects.create(author=self.user, text=text, image=legacy)
+            for text in ('Первый', 'Второй')
+        ]
+        call_command('migrate_post_images', '--dry-run', stdout=StringIO())
+        self.assertTrue(storage.exists(legacy))
+
+        call_command('migrate_post_images', stdout=StringIO())
+        names = {
+            Post.objects.get(pk=post.pk).image.name for post in posts
+        }
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(storage.is_content_addressed(name))
+        self.assertFalse(storage.exists(legacy))
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), b'GIF89a legacy')
+
+    def test_collect_media_removes_only_orphans(self):
+        live = Post.objects.create(
+            author=self.user, text='Живой',
+            image=SimpleUploadedFile('a.gif', SMALL_GIF),
+        )
+        thumbnails.process(live.pk)
+        live.refresh_from_db()
+        deleted = Post.objects.create(
+            author=self.user, text='Удаленный',
+            image=SimpleUploadedFile('b.gif', b'GIF89a deleted'),
+        )
+        orphan = deleted.image.name
+        deleted.delete()
+        storage = Post._meta.get_field('image').storage
+        stale_thumbnail = default.storage.save(
+            'cache/00/00/stale.jpg', SimpleUploadedFile('x', b'stale')
+        )
+        kept = [live.image.name, live.thumbnails['card']['url'][
+            len(settings.MEDIA_URL):
+        ]]
+
+        call_command('collect_media', '--dry-run', '--min-age=0',
+                     stdout=StringIO())
+        self.assertTrue(storage.exists(orphan))
+
+        out = StringIO()
+        # пачка из двух файлов проверяется двумя запросами
+        with mock.patch(
+            'posts.management.commands.collect_media.MAX_QUERY_PARAMS', 1
+        ):
+            call_command('collect_media', '--min-age=0', '--batch-size=2',
+                         stdout=out)
+        self.assertFalse(storage.exists(orphan))
+        self.assertFalse(default.storage.exists(stale_thumbnail))
+        for name in kept:
+            self.assertTrue(storage.exists(name), name)
+        self.assertIn('Удалено файлов: 2', out.getvalue())
+
+    def test_collect_media_skips_fresh_files(self):
+        post = Post.objects.create(
+            author=self.user, text='Удаленный',
+            image=SimpleUploadedFile('c.gif', b'GIF89a fresh'),
+        )
+        name = post.image.name
+        post.delete()
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(
+            Post._meta.get_field('image').storage.exists(name)
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def jpeg(self, size, orientation=None):
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        buffer.name = 'photo.jpg'
+        buffer.seek(0)
+        return buffer
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': image},
+        )
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100)
+    def test_upload_over_byte_cap_is_rejected(self):
+        response = self.create(self.jpeg((64, 64)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        self.create(self.jpeg((64, 64)))
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_image_is_downscaled_without_exif(self):
+        # ориентация 6: камера повернута, картинку нужно повернуть на 90
+        self.create(self.jpeg((400, 200), orientation=6))
+        post = Post.objects.get()
+        with post.image.open() as file:
+            image = Image.open(file)
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+
+    def animation(self, size):
+        exif = Image.Exif()
+        # 0x8825 - блок GPS
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}
+        frames = [Image.new('RGB', size, color) for color in ('red', 'blue')]
+        buffer = BytesIO()
+        frames[0].save(
+            buffer, 'WEBP', save_all=True, append_images=frames[1:],
+            exif=exif, duration=100,
+        )
+        buffer.name = 'animation.webp'
+        buffer.seek(0)
+        return buffer
+
+    def test_animation_keeps_frames_without_exif(self):
+        self.create(self.animation((64, 32)))
+        post = Post.objects.get()
+        with post.image.open() as file:
+            image = Image.open(file)
+            self.assertEqual(image.n_frames, 2)
+            self.assertEqual(image.size, (64, 32))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_animation_is_rejected(self):
+        response = self.create(self.animation((200, 50)))
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(Post.objects.exists())
+
+    def test_small_image_without_exif_is_kept(self):
+        self.create(SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'))
+        post = Post.objects.get()
+        with post.image.open() as file:
+            self.assertEqual(file.read(), SMALL_GIF)
@@ -1,3 +1,6 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -27,3 +30,10 @@ class PostModelTest(TestCase):
                          ('Post.__str__ не работает'))
         self.assertEqual(str(self.group), self.group.title,
                          ('Group.__str__ не работает'))
+
+
+class FeedQueryPlanTest(TestCase):
+    def test_feed_queries_use_indexes(self):
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        self.assertNotIn('[FAIL]', out.getvalue())
@@ -1,13 +1,30 @@
+import base64
+import time
+from io import StringIO
+from unittest import mock
+
 from django import forms
+from django.core.management import call_command
 from django.urls import reverse
-from django.test import TestCase, Client
+from django.test import (
+    TestCase, TransactionTestCase, Client, RequestFactory, override_settings,
+)
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_init
+from django.test.utils import CaptureQueriesContext
 
+from core import routers
 
-from ..models import Post, Group, Comment, Follow
+from .. import caching
+from ..models import (Post, Group, Comment, Follow, TimelineEntry,
+                      UserStats)
+from ..utils import MAX_PAGE, CountUnavailable, module_paginator
 
 
 User = get_user_model()
@@ -240,6 +257,18 @@ class ViewTestCase(TestCase):
         self.assertEqual(Comment.objects.count(), count_comment + 1)
 
 
+class BumpAfterCommitTestCase(TransactionTestCase):
+    def test_generation_is_bumped_again_after_commit(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        before = caching.get_generations(['all'])
+        with transaction.atomic():
+            Post.objects.create(text='В транзакции', author=author)
+            during = caching.get_generations(['all'])
+            self.assertNotEqual(during, before)
+        self.assertNotEqual(caching.get_generations(['all']), during)
+
+
 class PostCacheTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -251,11 +280,114 @@ class PostCacheTestCase(TestCase):
         self.guest_client = Client()
 
     def test_posts_cache(self):
+        self.guest_client.get(reverse("posts:index"))
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(reverse("posts:index"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_post_invalidates_cache(self):
         self.guest_client.get(reverse("posts:index"))
         text = "Проверка кеширования"
+        post = Post.objects.create(text=text, author=self.author)
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertContains(response, text)
+        post.delete()
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertNotContains(response, text)
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_cache_rebuild_reads_from_primary(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        router = routers.ReplicaRouter()
+
+        @caching.cached_view(lambda request: ['rebuild'])
+        def view(request):
+            return HttpResponse(router.db_for_read(Post))
+
+        request = RequestFactory().get('/rebuild/')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request).content, b'default')
+        self.assertFalse(routers.is_pinned())
+
+    def test_stale_page_served_while_rebuild_locked(self):
+        etag = self.guest_client.get(reverse("posts:index"))['ETag']
+        request = RequestFactory().get(reverse("posts:index"))
+        lock = f'{caching.page_key(request, shared=True)}:lock'
+        cache.add(lock, True)
+        text = "Пост во время перестройки"
         Post.objects.create(text=text, author=self.author)
         response = self.guest_client.get(reverse("posts:index"))
         self.assertNotContains(response, text)
+        # старая копия отдается со своим ETag, а не с ETag новой
+        self.assertEqual(response['ETag'], etag)
+        cache.delete(lock)
+        response = self.guest_client.get(
+            reverse("posts:index"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertContains(response, text)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_index_cache_shared_with_personal_header(self):
+        self.guest_client.get(reverse("posts:index"))
+        user_client = Client()
+        user_client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = user_client.get(reverse("posts:index"))
+        self.assertFalse(
+            any('posts_post' in query['sql'] for query in queries)
+        )
+        self.assertContains(response, f'Пользователь: {self.author.username}')
+        self.assertContains(response, reverse("posts:follow_index"))
+        self.assertNotContains(response, '<!--chrome:')
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertNotContains(response, 'Пользователь:')
+
+    def test_conditional_get_skips_feed_query(self):
+        post = Post.objects.create(text="Пост", author=self.author)
+        urls = [
+            reverse("posts:index"),
+            reverse("posts:profile",
+                    kwargs={"username": self.author.username}),
+            reverse("posts:post_detail", kwargs={"post_id": post.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any(
+                    '"posts_post"."text"' in query['sql']
+                    for query in queries
+                ))
+
+    def test_etag_changes_with_content(self):
+        url = reverse("posts:index")
+        etag = self.guest_client.get(url)['ETag']
+        Post.objects.create(text="Новый пост", author=self.author)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_page_refreshed_early_before_expiry(self):
+        entry = caching.CachedPage(None, [1], time.time() + 1, 10)
+        with mock.patch('posts.caching.random.random', return_value=0.5):
+            self.assertFalse(caching.is_fresh(entry, [1]))
+        entry = caching.CachedPage(None, [1], time.time() + 60, 0.01)
+        self.assertTrue(caching.is_fresh(entry, [1]))
+        self.assertFalse(caching.is_fresh(entry, [2]))
+
+    def test_comment_invalidates_post_detail(self):
+        post = Post.objects.create(text="Пост", author=self.author)
+        url = reverse("posts:post_detail", kwargs={"post_id": post.pk})
+        self.guest_client.get(url)
+        Comment.objects.create(
+            post=post, author=self.author, text="Новый комментарий"
+        )
+        self.assertContains(self.guest_client.get(url), "Новый комментарий")
 
 
 class FollowTestCase(TestCase):
@@ -322,6 +454,52 @@ class FollowTestCase(TestCase):
                 author__following__user=self.authorized).count(),
             count)
 
+    def test_follow_index_without_stats_row(self):
+        UserStats.objects.filter(user=self.authorized).delete()
+        self.authorized.refresh_from_db()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['count'], 0)
+
+    def test_follow_updates_follower_profile(self):
+        cache.clear()
+        url = reverse('posts:profile', kwargs={'username': self.authorized})
+        self.authorized_client.get(url)
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author}))
+        self.assertContains(self.authorized_client.get(url), 'подписок: 1')
+
+    def test_follow_backfills_and_unfollow_trims_timeline(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author}))
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.authorized, post=self.post).exists()
+        )
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.authorized).exists()
+        )
+
+    def test_new_post_fanned_out_to_follow_page(self):
+        Follow.objects.create(
+            user=self.authorized,
+            author=self.author,
+        )
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост в ленту подписчика'},
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'][0].text, 'Пост в ленту подписчика'
+        )
+        self.assertEqual(len(response.context['page_obj']), 2)
+
 
 class PaginatorViewsTestCase(TestCase):
     @classmethod
@@ -381,3 +559,318 @@ class PaginatorViewsTestCase(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  self.PAGE_TEST_OVERAGE
                                  )
+
+    def test_cursor_links_walk_all_posts(self):
+        cache.clear()
+        response = self.author_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertIsNone(first_page.prev_cursor)
+        self.assertIsNotNone(first_page.next_cursor)
+
+        response = self.author_client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor}
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), self.PAGE_TEST_OVERAGE)
+        self.assertEqual(second_page.number, 2)
+        self.assertIsNone(second_page.next_cursor)
+        shown = {post.pk for post in first_page} | {
+            post.pk for post in second_page}
+        self.assertEqual(len(shown), Post.objects.count())
+
+        response = self.author_client.get(
+            reverse('posts:index'), {'cursor': second_page.prev_cursor}
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in first_page],
+        )
+
+    def test_cursor_page_skips_count_query(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            page_obj = module_paginator(
+                Post.objects.all(), RequestFactory().get('/')
+            )['page_obj']
+            list(page_obj)
+            # число страниц известно без COUNT(*)
+            self.assertTrue(page_obj.has_next())
+            self.assertTrue(page_obj.has_other_pages())
+            self.assertEqual(
+                (page_obj.start_index(), page_obj.end_index()),
+                (1, settings.NUMB_PAGIN),
+            )
+        with self.assertRaises(CountUnavailable):
+            page_obj.paginator.count
+
+    def test_second_page_indexes_without_count(self):
+        cache.clear()
+        page_obj = module_paginator(
+            Post.objects.all(), RequestFactory().get('/', {'page': 2})
+        )['page_obj']
+        self.assertEqual(
+            (page_obj.start_index(), page_obj.end_index()),
+            (settings.NUMB_PAGIN + 1, Post.objects.count()),
+        )
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        cache.clear()
+        response = self.author_client.get(
+            reverse('posts:index'), {'cursor': 'broken'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_huge_page_number_gives_empty_page(self):
+        cache.clear()
+        response = self.author_client.get(
+            reverse('posts:index'), {'page': '9' * 23}
+        )
+        self.assertEqual(response.status_code, 200)
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, MAX_PAGE)
+        self.assertEqual(len(page_obj), 0)
+
+    def test_out_of_range_cursor_falls_back_to_first_page(self):
+        date = Post.objects.first().pub_date.isoformat()
+        payloads = (
+            f'[["{date}",1],Infinity,0]',
+            f'[["{date}",1],1.5,0]',
+            f'[["{date}",{2 ** 64}],2,0]',
+            f'[[1e400,{2 ** 64}],2,0]',
+        )
+        for payload in payloads:
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            for url in (reverse('posts:index'), reverse('posts:search')):
+                with self.subTest(payload=payload, url=url):
+                    cache.clear()
+                    response = self.author_client.get(
+                        url, {'q': 'текст', 'cursor': cursor}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.context['page_obj'].number, 1)
+
+
+class GroupPageScaleTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Большая группа',
+            slug='big-slug',
+            description='Много постов',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def add_posts(self, count):
+        Post.objects.bulk_create(
+            Post(author=self.author, group=self.group, text=f'Пост {i}')
+            for i in range(count)
+        )
+
+    def get_group_page(self):
+        """Возвращает число запросов и созданных объектов Post."""
+        cache.clear()
+        loaded = []
+
+        def count_post(sender, instance, **kwargs):
+            loaded.append(instance)
+
+        post_init.connect(count_post, sender=Post)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.guest_client.get(
+                    reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+                )
+        finally:
+            post_init.disconnect(count_post, sender=Post)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), len(loaded)
+
+    def test_group_page_cost_does_not_grow_with_group(self):
+        self.add_posts(settings.NUMB_PAGIN * 2)
+        small_queries, small_loaded = self.get_group_page()
+        self.add_posts(settings.NUMB_PAGIN * 200)
+        big_queries, big_loaded = self.get_group_page()
+        self.assertEqual(big_queries, small_queries)
+        self.assertEqual(big_loaded, small_loaded)
+        self.assertLessEqual(big_loaded, settings.NUMB_PAGIN + 1)
+
+
+class FeedQueryCountTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(settings.NUMB_PAGIN)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_urls(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.authors[0].username}),
+            reverse('posts:follow_index'),
+        ]
+
+    def count_queries(self):
+        counts = {}
+        for url in self.feed_urls():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        Post.objects.create(
+            author=self.authors[0], group=self.group, text='Первый пост'
+        )
+        one_post = self.count_queries()
+        for author in self.authors:
+            Post.objects.create(author=author, group=self.group, text='Пост')
+        full_page = self.count_queries()
+        for url in self.feed_urls():
+            with self.subTest(url=url):
+                self.assertEqual(full_page[url], one_post[url])
+
+
+class CountersTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_views(self):
+        self.author_client.post(
+            reverse('posts:post_create'), data={'text': 'Новый пост'}
+        )
+        post = Post.objects.get(author=self.author)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Комментарий'},
+        )
+        self.reader_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_stats_repairs_drift(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=42, followers_count=7
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=3)
+
+        call_command('recount_stats', stdout=StringIO())
+
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Кошки любят спать на солнце'
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Собаки любят гулять'
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.context.get('page_obj') or []
+
+    def test_search_finds_posts_by_word_prefix(self):
+        self.assertEqual(list(self.search('кошк')), [self.post])
+        self.assertEqual(len(self.search('любят')), 2)
+        self.assertEqual(list(self.search('"; DROP')), [])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_search_index_follows_posts_and_comments(self):
+        comment = Comment.objects.create(
+            post=self.other, author=self.author, text='Хвост трубой'
+        )
+        self.assertEqual(list(self.search('хвост')), [self.other])
+        comment.delete()
+        self.assertEqual(list(self.search('хвост')), [])
+
+        self.post.text = 'Попугаи'
+        self.post.save()
+        self.assertEqual(list(self.search('попугаи')), [self.post])
+        self.assertEqual(list(self.search('кошки')), [])
+
+    def test_search_keyset_pagination(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Ежик номер {i}')
+            for i in range(settings.NUMB_PAGIN + 2)
+        )
+        first_page = self.search('ежик')
+        self.assertEqual(len(first_page), settings.NUMB_PAGIN)
+        second_page = self.search('ежик', cursor=first_page.next_cursor)
+        self.assertEqual(len(second_page), 2)
+        self.assertFalse(
+            {post.pk for post in first_page}
+            & {post.pk for post in second_page}
+        )
+        previous = self.search('ежик', cursor=second_page.prev_cursor)
+        self.assertEqual(list(previous), list(first_page))
+
+    def test_rebuild_search(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        call_command('rebuild_search', stdout=StringIO())
+        self.assertEqual(list(self.search('собаки')), [self.other])
@@ -0,0 +1,127 @@
+import base64
+import io
+import json
+from collections import namedtuple
+
+from PIL import Image
+from sorl.thumbnail import default
+
+from core import metrics
+from jobs.queue import enqueue
+
+from .models import Post
+
+Preset = namedtuple('Preset', ('size', 'widths', 'options', 'sizes'))
+
+# все миниатюры, которые выводят шаблоны постов: для каждой ширины
+# из widths создается копия в каждом из FORMATS, браузер выбирает
+# подходящую по атрибуту sizes
+PRESETS = {
+    'card': Preset(
+        (960, 339),
+        (320, 480, 640, 960),
+        {'crop': 'left', 'upscale': True},
+        '(max-width: 992px) 100vw, 960px',
+    ),
+    'detail': Preset(
+        (960, 339),
+        (320, 480, 640, 960),
+        {'crop': 'center', 'upscale': True},
+        '(max-width: 768px) 100vw, 75vw',
+    ),
+}
+# WebP для браузеров, которые его понимают, JPEG - для остальных
+FORMATS = {
+    'WEBP': {'quality': 80},
+    'JPEG': {'quality': 85},
+}
+FALLBACK_FORMAT = 'JPEG'
+# заглушка - крошечная копия картинки, браузер растягивает ее с размытием
+PLACEHOLDER_SIZE = (16, 16)
+PLACEHOLDER_QUALITY = 50
+
+
+def placeholder(source):
+    """data: URI маленькой JPEG-копии картинки."""
+    # JPEG декодируется сразу в уменьшенном масштабе
+    source.draft('RGB', (PLACEHOLDER_SIZE[0] * 8, PLACEHOLDER_SIZE[1] * 8))
+    small = source.convert('RGB')
+    small.thumbnail(PLACEHOLDER_SIZE)
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=PLACEHOLDER_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def render_preset(name, preset):
+    """Все ширины и форматы пресета.
+
+    Возвращает {'url', 'width', 'height', 'sources'}, где url и размеры -
+    у самой широкой копии в FALLBACK_FORMAT, а sources - списки
+    [url, ширина] по форматам.
+    """
+    width, height = preset.size
+    sources = {}
+    for format_, options in FORMATS.items():
+        sources[format_] = []
+        for target in preset.widths:
+            geometry = f'{target}x{round(height * target / width)}'
+            thumbnail = default.backend.get_thumbnail(
+                name, geometry, format=format_, **options, **preset.options
+            )
+            sources[format_].append([thumbnail.url, thumbnail.width])
+    url, _ = sources[FALLBACK_FORMAT][-1]
+    return {
+        'url': url,
+        'width': width,
+        'height': height,
+        'sources': sources,
+    }
+
+
+def describe(image):
+    """Значения полей Post.IMAGE_FIELDS для файла картинки."""
+    with image.storage.open(image.name) as file:
+        source = Image.open(file)
+        width, height = source.size
+        lqip = placeholder(source)
+    thumbs = {
+        name: render_preset(image.name, preset)
+        for name, preset in PRESETS.items()
+    }
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_placeholder': lqip,
+        'image_thumbnails': json.dumps(thumbs),
+    }
+
+
+def process(post_id):
+    """Создает миниатюры и сохраняет данные картинки в пост.
+
+    Выполняется исполнителем очереди задач; если картинку успели
+    заменить, результат отбрасывается - новую обработает своя задача.
+    """
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    name = post.image.name
+    with metrics.THUMBNAIL_LATENCY.time():
+        fields = describe(post.image)
+    post.refresh_from_db(fields=['image'])
+    if post.image.name != name:
+        return
+    for field, value in fields.items():
+        setattr(post, field, value)
+    post.save(update_fields=Post.IMAGE_FIELDS)
+
+
+def schedule(post):
+    """Ставит обработку картинки в очередь задач.
+
+    Задача пишется в транзакции сохранения поста и становится видна
+    исполнителю только после коммита.
+    """
+    if post.image:
+        enqueue(process, post.pk)
@@ -0,0 +1,56 @@
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry
+from .utils import module_paginator
+
+TIMELINE_KEYS = ('pub_date', 'post_id')
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def timeline_paginator(user, request):
+    entries = TimelineEntry.objects.filter(user=user).only(
+        'post_id', 'pub_date'
+    )
+    context = module_paginator(entries, request, keys=TIMELINE_KEYS)
+    page_obj = context['page_obj']
+    posts = Post.objects.for_feed().in_bulk(
+        [entry.post_id for entry in page_obj]
+    )
+    page_obj.object_list = [
+        posts[entry.post_id] for entry in page_obj if entry.post_id in posts
+    ]
+    return context
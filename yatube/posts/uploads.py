@@ -0,0 +1,111 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler,
+)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# форматы, которые сохраняются без потерь или где важна прозрачность,
+# перекодируются в себя же; остальное - в JPEG
+KEEP_FORMATS = {'PNG', 'GIF', 'WEBP'}
+JPEG_QUALITY = 90
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл и обрывает ее на лимите.
+
+    Файл никогда не держится в памяти целиком. Если он больше
+    POST_IMAGE_MAX_BYTES, остаток не сохраняется, а причина попадает
+    в request.upload_errors, откуда ее показывает форма.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.file.close()
+            errors(self.request)[self.field_name] = (
+                'Файл больше '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_BYTES)}'
+            )
+            raise SkipFile()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def errors(request):
+    if not hasattr(request, 'upload_errors'):
+        request.upload_errors = {}
+    return request.upload_errors
+
+
+def prepare_image(upload):
+    """Проверяет размеры картинки и готовит ее к сохранению.
+
+    Размеры читаются из заголовка, до декодирования пикселей. Если в
+    картинке есть EXIF или она больше POST_IMAGE_MAX_SIDE, она
+    перекодируется: поворот из EXIF применяется, метаданные
+    отбрасываются. Анимация больше POST_IMAGE_MAX_SIDE отклоняется,
+    а с EXIF - перекодируется со всеми кадрами. Иначе возвращается
+    исходный файл.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f'Картинка {width}x{height} слишком большая',
+            code='too_many_pixels',
+        )
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    # MPO с камер тоже "анимация", но это JPEG: берется первый кадр
+    animated = (
+        image.format in KEEP_FORMATS and getattr(image, 'is_animated', False)
+    )
+    if animated and max(width, height) > max_side:
+        # уменьшать пришлось бы каждый кадр, это слишком дорого
+        raise ValidationError(
+            f'Анимация {width}x{height} больше {max_side} пикселей '
+            'по стороне',
+            code='animation_too_large',
+        )
+    exif = image.getexif()
+    if not exif and max(width, height) <= max_side:
+        upload.seek(0)
+        return upload
+    if animated:
+        return encoded(image, upload.name, image.format, save_all=True)
+    format_ = image.format if image.format in KEEP_FORMATS else 'JPEG'
+    # JPEG сразу декодируется в уменьшенном масштабе, это ограничивает
+    # память на одну загрузку
+    image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if format_ == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = {'quality': JPEG_QUALITY} if format_ == 'JPEG' else {}
+    return encoded(image, upload.name, format_, **options)
+
+
+def encoded(image, name, format_, **options):
+    """Картинка в формате format_ без метаданных, как файл загрузки."""
+    name, _ = os.path.splitext(name)
+    extension = 'jpg' if format_ == 'JPEG' else format_.lower()
+    # результат не больше POST_IMAGE_MAX_SIDE по стороне, его можно
+    # держать в памяти; временный файл хранилище переместило бы,
+    # и удалить его потом было бы некому
+    buffer = io.BytesIO()
+    image.save(buffer, format_, exif=b'', **options)
+    size = buffer.tell()
+    buffer.seek(0)
+    return InMemoryUploadedFile(
+        buffer, 'image', f'{name}.{extension}',
+        f'image/{format_.lower()}', size, None,
+    )
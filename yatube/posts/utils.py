@@ -1,12 +1,168 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+
 from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from core import metrics
+
+POST_KEYS = ('pub_date', 'pk')
+# больше не помещается в INTEGER SQLite
+MAX_PK = 2 ** 63 - 1
+# номер страницы в курсоре и в ?page=N: дальше OFFSET не нужен и
+# может не поместиться в INTEGER SQLite
+MAX_PAGE = 10 ** 6
+
+
+def valid_pk(value):
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and -MAX_PK - 1 <= value <= MAX_PK
+    )
+
+
+class CountUnavailable(Exception):
+    """Курсорный пагинатор не знает общего числа записей."""
+
+    # в шаблоне {{ paginator.count }} выводится пустым, а не дает 500
+    silent_variable_failure = True
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, pk) без COUNT(*) и OFFSET.
+
+    Курсор - непрозрачный токен с ключом граничной записи, направлением
+    и номером страницы (только для отображения). Всего записей
+    пагинатор не знает: count вызывает CountUnavailable, а num_pages -
+    номер последней известной страницы (текущей или следующей за ней),
+    поэтому has_next() и has_other_pages() у страницы не выполняют
+    COUNT(*).
+    """
+
+    def __init__(self, object_list, per_page, keys=POST_KEYS):
+        self.keys = keys
+        super().__init__(self.sort(object_list), per_page)
+        self.num_pages = 1
+
+    @property
+    def count(self):
+        raise CountUnavailable('CursorPaginator не считает записи')
+
+    def sort(self, object_list):
+        return object_list.order_by(*(f'-{key}' for key in self.keys))
+
+    def dump_key(self, row_key):
+        date, pk = row_key
+        return [date.isoformat(), pk]
+
+    def load_key(self, value):
+        date, pk = value
+        date = parse_datetime(date)
+        if date is None or not valid_pk(pk):
+            raise ValueError('Некорректный ключ курсора')
+        return date, pk
+
+    def encode_cursor(self, row_key, number, backwards=False):
+        payload = [self.dump_key(row_key), number, int(backwards)]
+        token = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode()
+        )
+        return token.decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            row_key, number, backwards = json.loads(
+                base64.urlsafe_b64decode(padded.encode())
+            )
+            row_key = self.load_key(row_key)
+            if type(number) is not int or not 1 <= number <= MAX_PAGE:
+                raise ValueError('Некорректный номер страницы')
+        except (ValueError, TypeError, OverflowError, binascii.Error):
+            return None
+        return row_key, number, bool(backwards)
+
+    def row_key(self, row):
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def seek(self, row_key, backwards=False):
+        date_key, pk_key = self.keys
+        date, pk = row_key
+        lookup = 'gt' if backwards else 'lt'
+        order = '' if backwards else '-'
+        # внешнее условие без OR дает диапазон по индексу (date, pk)
+        return self.object_list.filter(
+            Q(**{f'{date_key}__{lookup}e': date}),
+            Q(**{f'{date_key}__{lookup}': date})
+            | Q(**{f'{pk_key}__{lookup}': pk}),
+        ).order_by(f'{order}{date_key}', f'{order}{pk_key}')
+
+    def ordered(self):
+        return self.object_list
+
+    def build_page(self, rows, number, has_previous, has_next):
+        page = Page(rows, number, self)
+        page.prev_cursor = None
+        page.next_cursor = None
+        if rows and has_previous:
+            page.prev_cursor = self.encode_cursor(
+                self.row_key(rows[0]), number - 1, backwards=True
+            )
+        if rows and has_next:
+            page.next_cursor = self.encode_cursor(
+                self.row_key(rows[-1]), number + 1
+            )
+        self.num_pages = number + 1 if page.next_cursor else number
+        # Page.start_index() и end_index() опираются на count
+        first = (number - 1) * self.per_page + 1 if rows else 0
+        page.start_index = lambda: first
+        page.end_index = lambda: first and first + len(rows) - 1
+        return page
+
+    def cursor_page(self, cursor):
+        decoded = self.decode_cursor(cursor)
+        if decoded is None:
+            return self.offset_page(1)
+        row_key, number, backwards = decoded
+        rows = list(self.seek(row_key, backwards)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            number = number if has_more else 1
+            return self.build_page(rows, number, has_more, True)
+        return self.build_page(rows, number, True, has_more)
+
+    def offset_page(self, number):
+        """Поддержка старых ссылок вида ?page=N (без подсчета записей)."""
+        try:
+            number = min(max(int(number), 1), MAX_PAGE)
+        except (TypeError, ValueError):
+            number = 1
+        bottom = (number - 1) * self.per_page
+        rows = list(self.ordered()[bottom:bottom + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return self.build_page(
+            rows[:self.per_page], number, number > 1, has_next
+        )
+
+
+def get_page(paginator, request):
+    match = getattr(request, 'resolver_match', None)
+    feed = match.url_name if match else ''
+    with metrics.FEED_QUERY_LATENCY.time(feed=feed):
+        cursor = request.GET.get('cursor')
+        if cursor:
+            return paginator.cursor_page(cursor)
+        return paginator.offset_page(request.GET.get('page'))
 
 
-def module_paginator(post_list, request):
-    paginator = Paginator(post_list, settings.NUMB_PAGIN)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def module_paginator(post_list, request, keys=POST_KEYS):
+    paginator = CursorPaginator(post_list, settings.NUMB_PAGIN, keys)
     context = {
-        'page_obj': page_obj
+        'page_obj': get_page(paginator, request)
     }
     return context
@@ -1,34 +1,41 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.shortcuts import (
     render,
     redirect, get_object_or_404)
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.views.decorators.http import condition
 
+from . import caching, counters, uploads
 from .models import Post, Group, Follow, User
 from .forms import CommentForm, PostForm
-from .utils import module_paginator
+from .search import SearchPaginator, match_expression
+from .timeline import timeline_paginator
+from .utils import get_page, module_paginator
 
 
-@cache_page(20)
+@condition(etag_func=caching.page_etag(caching.index_scopes))
+@caching.cached_view(caching.index_scopes, shared=True)
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     context_pagin = module_paginator(post_list, request)
     return render(request, "posts/index.html", context_pagin)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    count = Follow.objects.count()
+    count = counters.user_stats(request.user).following_count
     context = {
-        'posts': posts,
         'count': count,
     }
-    context.update(module_paginator(posts, request))
+    context.update(timeline_paginator(request.user, request))
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     post_author = get_object_or_404(User, username=username)
     follower = request.user
@@ -41,6 +48,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     post_author = get_object_or_404(User, username=username)
     follower = request.user
@@ -51,19 +59,37 @@ def profile_unfollow(request, username):
     return redirect('posts:profile', post_author)
 
 
+@condition(etag_func=caching.page_etag(caching.group_scopes))
+@caching.cached_view(caching.group_scopes, shared=True)
 def group_posts(request, slug):
-    group = get_object_or_404(Group.objects.all().prefetch_related('posts'),
-                              slug=slug
-                              )
+    group = get_object_or_404(Group, slug=slug)
     context = {
         'group': group,
     }
-    context.update(module_paginator(group.posts.all(), request))
+    context.update(
+        module_paginator(group.posts.for_feed(), request)
+    )
     return render(request, "posts/group_list.html", context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'extra_query': urlencode({'q': query}) + '&',
+    }
+    if match_expression(query):
+        context['page_obj'] = get_page(
+            SearchPaginator(query, settings.NUMB_PAGIN), request
+        )
+    return render(request, 'posts/search.html', context)
+
+
+@condition(etag_func=caching.page_etag(caching.profile_scopes))
+@caching.cached_view(caching.profile_scopes)
 def profile(request, username):
-    posts_author = get_object_or_404(User, username=username)
+    posts_author = get_object_or_404(User.objects.select_related('stats'),
+                                     username=username)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -74,14 +100,20 @@ def profile(request, username):
         'posts_author': posts_author,
         'following': following,
     }
-    context.update(module_paginator(posts_author.posts.all(), request))
+    context.update(
+        module_paginator(posts_author.posts.for_feed(), request)
+    )
     return render(request, "posts/profile.html", context)
 
 
+@condition(etag_func=caching.page_etag(caching.post_scopes))
+@caching.cached_view(caching.post_scopes, anonymous_only=True)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
         'form': form,
@@ -91,11 +123,13 @@ def post_detail(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     if request.method == 'POST':
         form = PostForm(
             request.POST,
             files=request.FILES or None,
+            upload_errors=uploads.errors(request),
         )
         if form.is_valid():
             post = form.save(commit=False)
@@ -116,7 +150,8 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=uploads.errors(request),
     )
     if form.is_valid():
         form.save()
@@ -130,6 +165,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = Post.objects.get(pk=post_id)
     form = CommentForm(request.POST or None)
@@ -1,10 +1,16 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
+
 from dotenv import load_dotenv
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure_403'
 
 NUMB_POST: int = 10
 NUMB_PAGIN: int = 10
+TIMELINE_BACKFILL: int = 200
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -38,12 +44,16 @@ INSTALLED_APPS = [
     'about.apps.AboutConfig',
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +66,8 @@ MIDDLEWARE = [
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера
+        'BACKEND': 'core.instrumentation.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,7 +89,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # постоянные соединения: 0 - новое на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+    }
+}
+
+# Реплика только для чтения, например копия файла базы,
+# которую поддерживает litestream; без нее все идет в default
+REPLICA_DATABASE = None
+if os.environ.get('DB_REPLICA_NAME'):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DB_REPLICA_NAME'],
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# сколько секунд после записи пользователь читает из основной базы
+REPLICA_PIN_SECONDS = 10
+
+# Применяются к каждому новому соединению с SQLite (core/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,  # 20 МБ
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -119,16 +157,120 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма ставятся в очередь, а отправляет их runworker --queue mail
+# пачками через QUEUED_EMAIL_BACKEND
+EMAIL_BACKEND = 'jobs.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_BATCH_SIZE = 100
+# задержка перед отправкой, чтобы набралась пачка
+EMAIL_FLUSH_DELAY = 0
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Страницы лент инвалидируются сигналами, поэтому могут жить долго
+FEED_CACHE_TIMEOUT = 6 * 60 * 60
+# Сколько отдавать устаревшую копию, пока ее перестраивает другой запрос
+FEED_CACHE_STALE_TIMEOUT = 10 * 60
+FEED_CACHE_LOCK_TIMEOUT = 30
+FEED_CACHE_LOCK_WAIT = 2
+
+# Общий для всех воркеров кеш в файле SQLite
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
 
+# Очередь фоновых задач в базе (jobs), исполнитель - manage.py runworker.
+# Без --queue исполнитель обслуживает все очереди из JOBS_QUEUES:
+# default (миниатюры и прочее) и mail (отправка писем)
+JOBS_QUEUES = ['default', 'mail']
+JOBS_WORKER_THREADS = 2
+JOBS_POLL_INTERVAL = 1
+# на сколько секунд задача закрепляется за исполнителем
+JOBS_LEASE = 5 * 60
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_MAX_DELAY = 60 * 60
+
+# Загрузки пишутся во временный файл и обрываются на лимите размера,
+# картинки больше POST_IMAGE_MAX_SIDE уменьшаются перед сохранением
+FILE_UPLOAD_HANDLERS = ['posts.uploads.CappedUploadHandler']
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_SIDE = 2560
+
+# Замеры запросов (core.middleware.InstrumentationMiddleware): какая доля
+# запросов пишется в журнал строками JSON. Журнал идет в stderr, а если
+# задан REQUEST_LOG_FILE - в этот файл; его может писать несколько
+# процессов, поэтому ротацию делает logrotate, а не сам Python
+INSTRUMENTATION_SAMPLE_RATE = float(
+    os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 0.01)
+)
+REQUEST_LOG_FILE = os.environ.get('REQUEST_LOG_FILE')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'requests': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': REQUEST_LOG_FILE,
+            'formatter': 'message',
+            'delay': True,
+        } if REQUEST_LOG_FILE else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Метрики для Prometheus (core.metrics): каждый процесс пишет значения
+# в свой файл в METRICS_DIR, /metrics суммирует все файлы. Каталог
+# стоит очищать при перезапуске сервиса. Если задан METRICS_TOKEN,
+# /metrics отдается только с заголовком Authorization: Bearer <токен>,
+# иначе - только на адреса из INTERNAL_IPS
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Профилирование запросов (core.middleware.ProfilingMiddleware): файлы
+# .pstats пишутся в PROFILE_DIR, токен из manage.py profile_token
+# действует PROFILE_TOKEN_MAX_AGE секунд, доля PROFILE_SAMPLE_RATE
+# запросов профилируется без токена
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(BASE_DIR, 'profiles')
+)
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# тесты пишут кеш, метрики и профили во временный каталог, а не в каталоги
+# разработчика или сервера: cache.clear() в тестах стер бы кеш, а файлы
+# метрик попали бы в итоги /metrics. Журнал запросов в тестах не пишется
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    TEST_DIR = tempfile.mkdtemp(prefix='yatube-test-')
+    atexit.register(shutil.rmtree, TEST_DIR, True)
+    CACHES['default']['LOCATION'] = os.path.join(TEST_DIR, 'cache.sqlite3')
+    METRICS_DIR = os.path.join(TEST_DIR, 'metrics')
+    PROFILE_DIR = os.path.join(TEST_DIR, 'profiles')
+    INSTRUMENTATION_SAMPLE_RATE = 0
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -4,12 +4,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import metrics
+
 
 handler404 = 'core.views.page_not_found_404'
 handler403 = 'core.views.csrf_failure_403'
 handler500 = 'core.views.internal_server_error_500'
 
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),